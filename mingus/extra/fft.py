@@ -25,142 +25,415 @@ This module can also convert the found frequencies to Note objects.
 
 import wave
 import struct
+import tempfile
 import numpy
 from mingus.containers.note import Note
-from numpy.fft import fft as _fft
-import operator
+from numpy.fft import rfft as _rfft
 
 # Making a frequency-amplitude table   Adapted some ideas and source from:
 # http://xoomer.virgilio.it/sam_psy/psych/sound_proc/sound_proc_python.html
 #
 # The log function turns out to be really, really slow, which adds up quickly.
-# So before we do any performance critical calculations we set up a cache of all
-# the frequencies we need to look up.
+# So the frequencies of all the notes are kept in a sorted array, in which
+# whole arrays of frequencies are looked up at once with searchsorted.
 
-_log_cache = []
-for x in xrange(129):
-    _log_cache.append(Note().from_int(x).to_hertz())
-_last_asked = None
+_log_cache = numpy.array([Note().from_int(x).to_hertz() for x in range(129)])
 
-def _find_log_index(f):
-    """Look up the index of the frequency f in the frequency table.
+# Maps from the bins of a spectrum to notes, by (sample rate, number of
+# samples, maxNote). The cache is cleared when it holds _max_pitch_maps maps.
+_pitch_maps = {}
+_max_pitch_maps = 32
 
-    Return the nearest index.
+def _log_index(frequencies, maxNote=100):
+    """Return the indices of the notes nearest to an array of frequencies.
+
+    The index of a frequency f is the n for which _log_cache[n - 1] < f <=
+    _log_cache[n]. Frequencies above the table and notes at or above maxNote
+    get index 128; frequencies of zero and below get 129.
     """
-    global _last_asked, _log_cache
-    (begin, end) = (0, 128)
-
-    # Most calls are sequential, this keeps track of the last value asked for so
-    # that we need to search much, much less.
-    if _last_asked is not None:
-        (lastn, lastval) = _last_asked
-        if f >= lastval:
-            if f <= _log_cache[lastn]:
-                _last_asked = (lastn, f)
-                return lastn
-            elif f <= _log_cache[lastn + 1]:
-                _last_asked = (lastn + 1, f)
-                return lastn + 1
-            begin = lastn
-
-    # Do some range checking
-    if f > _log_cache[127] or f <= 0:
-        return 128
-
-    # Binary search related algorithm to find the index
-    while begin != end:
-        n = (begin + end) // 2
-        c = _log_cache[n]
-        cp = _log_cache[n - 1] if n != 0 else 0
-        if cp < f <= c:
-            _last_asked = (n, f)
-            return n
-        if f < c:
-            end = n
-        else:
-            begin = n
-    _last_asked = (begin, f)
-    return begin
+    frequencies = numpy.asarray(frequencies, float)
+    index = numpy.searchsorted(_log_cache[:128], frequencies)
+    index[index >= maxNote] = 128
+    index[frequencies <= 0] = 129
+    return index
 
-def find_frequencies(data, freq=44100, bits=16):
+def _pitch_map(freq, n, maxNote=100):
+    """Return the note indices of the bins in the spectrum of n samples at
+    sample rate freq. The maps are cached."""
+    key = (freq, n, maxNote)
+    pitches = _pitch_maps.get(key)
+    if pitches is None:
+        pitches = _log_index(numpy.arange(n // 2 + 1) * (freq / float(n)),
+                             maxNote)
+        if len(_pitch_maps) >= _max_pitch_maps:
+            _pitch_maps.clear()
+        _pitch_maps[key] = pitches
+    return pitches
+
+def _loudest(amplitudes):
+    """Return the Note with the highest amplitude in an array from
+    find_note_amplitudes, or None if that is the bin above maxNote. Of equal
+    amplitudes the highest note wins."""
+    x = len(amplitudes) - 1 - amplitudes[::-1].argmax()
+    return (Note().from_int(x) if x < 128 else None)
+
+def _power(p, n):
+    """Turn the output of rfft for n samples into amplitudes, along the last
+    axis."""
+    p = numpy.abs(p)
+    p /= float(n)
+    p **= 2
+    p *= 2
+    p[..., 0] /= 2
+    if n % 2 == 0:
+        p[..., -1] /= 2
+    return p
+
+def find_spectrum(data, freq=44100, bits=16):
     """Convert audio data into a frequency-amplitude table using fast fourier
     transformation.
 
-    Return a list of tuples (frequency, amplitude).
+    Return two numpy arrays: the frequencies and their amplitudes.
 
     Data should only contain one channel of audio.
     """
-    # Fast fourier transform
     n = len(data)
-    p = _fft(data)
-    uniquePts = numpy.ceil((n + 1) / 2.0)
+    p = _power(_rfft(data), n)
+    return (numpy.arange(len(p)) * (freq / float(n)), p)
 
-    # Scale by the length (n) and square the value to get the amplitude
-    p = [(abs(x) / float(n)) ** 2 * 2 for x in p[0:uniquePts]]
-    p[0] = p[0] / 2
-    if n % 2 == 0:
-        p[-1] = p[-1] / 2
+def find_frequencies(data, freq=44100, bits=16):
+    """Convert audio data into a frequency-amplitude table using fast fourier
+    transformation.
+
+    Return a list of tuples (frequency, amplitude). See find_spectrum for a
+    version that returns arrays.
 
-    # Generate the frequencies and zip with the amplitudes
-    s = freq / float(n)
-    freqArray = numpy.arange(0, uniquePts * s, s)
-    return zip(freqArray, p)
+    Data should only contain one channel of audio.
+    """
+    (frequencies, amplitudes) = find_spectrum(data, freq, bits)
+    return list(zip(frequencies, amplitudes))
 
 def find_notes(freqTable, maxNote=100):
-    """Convert the (frequencies, amplitude) list to a (Note, amplitude) list."""
-    res = [0] * 129
-    n = Note()
-    for (freq, ampl) in freqTable:
-        if freq > 0 and ampl > 0:
-            f = _find_log_index(freq)
-            if f < maxNote:
-                res[f] += ampl
-            else:
-                res[128] += ampl
+    """Convert the (frequencies, amplitude) list to a (Note, amplitude)
+    list."""
+    table = numpy.array(list(freqTable), float).reshape(-1, 2)
+    amplitudes = numpy.where(table[:, 1] > 0, table[:, 1], 0)
+    res = numpy.bincount(_log_index(table[:, 0], maxNote), amplitudes,
+                         130)[:129]
     return [(Note().from_int(x) if x < 128 else None, n) for (x, n) in
             enumerate(res)]
 
-def data_from_file(file):
-    """Return (first channel data, sample frequency, sample width) from a .wav
-    file."""
-    fp = wave.open(file, 'r')
-    data = fp.readframes(fp.getnframes())
-    channels = fp.getnchannels()
-    freq = fp.getframerate()
-    bits = fp.getsampwidth()
-
-    # Unpack bytes -- warning currently only tested with 16 bit wavefiles. 32
-    # bit not supported.
-    data = struct.unpack(('%sh' % fp.getnframes()) * channels, data)
-
-    # Only use first channel
-    channel1 = []
-    n = 0
-    for d in data:
-        if n % channels == 0:
-            channel1.append(d)
-        n += 1
-    fp.close()
-    return (channel1, freq, bits)
+def find_note_amplitudes(data, freq=44100, bits=16, maxNote=100):
+    """Return an array with the amplitudes of the 128 MIDI notes in the one
+    channel audio data, like find_notes does for its spectrum.
+
+    The amplitude of the notes at or above maxNote is added to a 129th
+    element.
+    """
+    n = len(data)
+    amplitudes = _power(_rfft(data), n)
+    return numpy.bincount(_pitch_map(freq, n, maxNote), amplitudes,
+                          130)[:129]
+
+# WAV format tags
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_IEEE_FLOAT = 3
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# The numpy types of the samples by (format tag, sample width). 24 bit samples
+# are converted to int32 by _decode.
+_sample_types = {
+    (WAVE_FORMAT_PCM, 1): numpy.uint8,
+    (WAVE_FORMAT_PCM, 2): numpy.dtype('<i2'),
+    (WAVE_FORMAT_PCM, 3): numpy.dtype('<i4'),
+    (WAVE_FORMAT_PCM, 4): numpy.dtype('<i4'),
+    (WAVE_FORMAT_IEEE_FLOAT, 4): numpy.dtype('<f4'),
+    (WAVE_FORMAT_IEEE_FLOAT, 8): numpy.dtype('<f8'),
+    }
+
+def _wav_info(fp):
+    """Read the header of a WAV file up to the start of the sample data.
+
+    Return (format tag, channels, sample rate, sample width in bytes, offset
+    of the data, number of frames). Raise a wave.Error if the file is not a
+    WAV file this module can read.
+    """
+    header = fp.read(12)
+    if len(header) < 12 or header[:4] != b'RIFF' or header[8:] != b'WAVE':
+        raise wave.Error('file does not start with RIFF id')
+    offset = 12
+    fmt = None
+    while True:
+        chunk = fp.read(8)
+        if len(chunk) < 8:
+            raise wave.Error('fmt chunk and/or data chunk missing')
+        (name, size) = struct.unpack('<4sI', chunk)
+        offset += 8
+        if name == b'data':
+            break
+        body = fp.read(size + size % 2)
+        offset += size + size % 2
+        if name == b'fmt ':
+            fmt = body
+    if fmt is None or len(fmt) < 16:
+        raise wave.Error('data chunk before fmt chunk')
+    (tag, channels, freq, rate, align, bits) = struct.unpack('<HHIIHH',
+            fmt[:16])
+    if tag == WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 26:
+        tag = struct.unpack('<H', fmt[24:26])[0]
+    width = (bits + 7) // 8
+    if (tag, width) not in _sample_types or channels < 1:
+        raise wave.Error('unsupported format: %d, %d bits' % (tag, bits))
+    return (tag, channels, freq, width, offset, size // (width * channels))
+
+def _decode(raw, tag, width, channels, channel=0):
+    """Convert the bytes of whole frames in the uint8 array raw to samples.
+
+    Return the samples of channel, or their average over all channels if
+    channel is None. 8 bit samples are made signed (int16) and 24 bit
+    samples are returned as int32. The result is a view on raw if possible.
+    """
+    if width == 3:
+        b = raw.reshape(-1, channels, 3)
+        if channel is not None:
+            b = b[:, channel:channel + 1]
+        b = b.astype(numpy.int32)
+        x = b[..., 0] | b[..., 1] << 8 | b[..., 2] << 16
+        x -= (x & 0x800000) << 1
+        if channel is not None:
+            return x[:, 0]
+    else:
+        x = raw.view(_sample_types[(tag, width)]).reshape(-1, channels)
+        if width == 1:
+            x = x.astype(numpy.int16) - 128
+        if channel is not None:
+            return x[:, channel]
+    return x.mean(axis=1)
+
+def data_from_file(file, channel=0, mmap=False, block=1 << 20):
+    """Return (channel data, sample frequency, sample width) from a .wav
+    file.
+
+    The data is a numpy array with the samples of channel (the first by
+    default), or with the average of all the channels if channel is None.
+    8, 16, 24 and 32 bit PCM and 32 and 64 bit float files are supported.
+    The samples keep their values; 8 bit samples are made signed.
+
+    With mmap, file should be the name of a file (or a real file object).
+    The samples are then not read into memory: 16 and 32 bit and float
+    samples of one channel are returned as a read-only view on the file;
+    other samples are converted block frames at a time into a temporary
+    file that is mapped into memory.
+    """
+    if hasattr(file, 'read'):
+        fp = file
+    else:
+        fp = open(file, 'rb')
+    try:
+        (tag, channels, freq, width, offset, frames) = _wav_info(fp)
+        if channel is not None and not 0 <= channel < channels:
+            raise ValueError('The file has %d channels' % channels)
+        size = width * channels
+        if not mmap:
+            raw = numpy.frombuffer(fp.read(frames * size), numpy.uint8)
+            raw = raw[:len(raw) // size * size]
+            data = numpy.ascontiguousarray(_decode(raw, tag, width,
+                    channels, channel))
+            return (data, freq, width)
+        try:
+            fp.fileno()
+        except (AttributeError, IOError, ValueError):
+            raise ValueError('mmap needs a file on disk')
+        fp.seek(0, 2)
+        frames = min(frames, (fp.tell() - offset) // size)
+        if frames <= 0:
+            return (_decode(numpy.zeros(0, numpy.uint8), tag, width,
+                    channels, channel), freq, width)
+        raw = numpy.memmap(fp, numpy.uint8, 'r', offset, (frames * size, ))
+        if width in (2, 4, 8) and channel is not None:
+            return (_decode(raw, tag, width, channels, channel), freq, width)
+        first = _decode(raw[:size], tag, width, channels, channel)
+        data = numpy.memmap(tempfile.TemporaryFile(), first.dtype, 'w+',
+                            shape=(frames, ))
+        for i in range(0, frames, block):
+            data[i:i + block] = _decode(raw[i * size:(i + block) * size],
+                                        tag, width, channels, channel)
+        return (data, freq, width)
+    finally:
+        if fp is not file:
+            fp.close()
 
 def find_Note(data, freq, bits):
-    """Get the frequencies, feed them to find_notes and the return the Note
-    with the highest amplitude."""
-    data = find_frequencies(data, freq, bits)
-    return sorted(find_notes(data), key=operator.itemgetter(1))[-1][0]
+    """Get the amplitudes of the notes in the data and return the Note with
+    the highest amplitude."""
+    return _loudest(find_note_amplitudes(data, freq, bits))
+
+def _window(window, n):
+    """Return the window function to multiply frames of n samples with, or
+    None for a rectangular window."""
+    if window is None:
+        return None
+    if isinstance(window, str):
+        try:
+            return _windows[window](n)
+        except KeyError:
+            raise ValueError('Unknown window function %r' % window)
+    window = numpy.asarray(window, float)
+    if window.shape != (n, ):
+        raise ValueError('The window should have %d samples, not %s' % (n,
+                         window.shape))
+    return window
+
+_windows = {
+    'bartlett': numpy.bartlett,
+    'blackman': numpy.blackman,
+    'hamming': numpy.hamming,
+    'hann': numpy.hanning,
+    'hanning': numpy.hanning,
+    }
+
+def chunk_view(data, chunksize=512, hop=None):
+    """Return a 2-D view on the one channel data, with a frame of chunksize
+    samples every hop samples (by default chunksize: frames that don't
+    overlap) in its rows. The samples at the end that don't fill a frame are
+    left out.
+
+    The frames share the memory of the data, so they are made in constant
+    time, however much they overlap.
+    """
+    data = numpy.asarray(data)
+    if hop is None:
+        hop = chunksize
+    if hop < 1 or chunksize < 1:
+        raise ValueError('The chunksize and hop should be positive')
+    count = max((len(data) - chunksize) // hop + 1, 0)
+    stride = data.strides[0]
+    return numpy.lib.stride_tricks.as_strided(data, (count, chunksize),
+            (hop * stride, stride), writeable=False)
 
-def analyze_chunks(data, freq, bits, chunksize=512):
+def _frame_notes(frames, freq, window=None, maxNote=100):
+    """Return the index of the loudest note (see _loudest) in each row of
+    frames."""
+    (count, n) = frames.shape
+    if window is not None:
+        frames = frames * window
+    amplitudes = _power(_rfft(frames, axis=1), n)
+    pitches = _pitch_map(freq, n, maxNote) + 130 * numpy.arange(count)[:,
+            numpy.newaxis]
+    notes = numpy.bincount(pitches.ravel(), amplitudes.ravel(), 130
+                           * count).reshape(count, 130)[:, :129]
+    return 128 - notes[:, ::-1].argmax(axis=1)
+
+def analyze_chunks(data, freq, bits, chunksize=512, hop=None, window=None,
+                   batch=1024):
     """Cut the one channel data in chunks and analyzes them separately.
 
-    Making the chunksize a power of two works fastest.
+    Return the loudest Note (see find_Note) of every chunk. A chunk starts
+    every hop samples (by default every chunksize samples); the samples
+    after the last whole chunk are analyzed as a shorter chunk. Every chunk
+    is multiplied with window, which is the name of a window function
+    ('hann', 'hamming', 'blackman' or 'bartlett') or an array of chunksize
+    samples. By default the chunks are not windowed.
+
+    The chunks are transformed batch at a time, so the memory used doesn't
+    depend on the length of the data. Making the chunksize a power of two
+    works fastest.
     """
+    data = numpy.asarray(data, float)
+    if hop is None:
+        hop = chunksize
+    chunks = chunk_view(data, chunksize, hop)
+    w = _window(window, chunksize)
     res = []
-    while data != []:
-        f = find_frequencies(data[:chunksize], freq, bits)
-        res.append(sorted(find_notes(f), key=operator.itemgetter(1))[-1][0])
-        data = data[chunksize:]
+    for i in range(0, len(chunks), batch):
+        res.extend(_frame_notes(chunks[i:i + batch], freq, w))
+    res = [(Note().from_int(x) if x < 128 else None) for x in res]
+    rest = len(chunks) * hop
+    if rest < len(data):
+        res.append(_short_chunk_note(data[rest:rest + chunksize], freq,
+                   bits, window))
     return res
 
+def _short_chunk_note(chunk, freq, bits, window=None):
+    """Return the loudest Note in the chunk at the end of the data, which is
+    shorter than the others."""
+    w = _window(window, len(chunk))
+    if w is not None:
+        chunk = chunk * w
+    return find_Note(chunk, freq, bits)
+
+def iter_chunks(file, chunksize=512, hop=None, window=None, channel=0,
+                block=1 << 16):
+    """Read a .wav file block frames at a time and yield the loudest Note of
+    every chunk, like analyze_chunks does for data_from_file(file,
+    channel).
+
+    The samples of the chunks that overlap two blocks are kept until the
+    next block is read, so only about block + chunksize samples are in
+    memory at a time, however long the file is.
+    """
+    if hop is None:
+        hop = chunksize
+    w = _window(window, chunksize)
+    if hasattr(file, 'read'):
+        fp = file
+    else:
+        fp = open(file, 'rb')
+    try:
+        (tag, channels, freq, width, offset, frames) = _wav_info(fp)
+        if channel is not None and not 0 <= channel < channels:
+            raise ValueError('The file has %d channels' % channels)
+        size = width * channels
+        left = frames * size
+        data = numpy.zeros(0)
+        # The number of samples to drop before the next chunk starts, when
+        # the hop is longer than the data that was left
+        skip = 0
+        while left > 0:
+            raw = fp.read(min(block * size, left))
+            raw = numpy.frombuffer(raw[:len(raw) // size * size], numpy.uint8)
+            if not len(raw):
+                break
+            left -= len(raw)
+            data = numpy.concatenate((data, _decode(raw, tag, width,
+                                     channels, channel)))
+            if skip:
+                dropped = min(skip, len(data))
+                data = data[dropped:]
+                skip -= dropped
+            chunks = chunk_view(data, chunksize, hop)
+            if len(chunks):
+                for x in _frame_notes(chunks, freq, w):
+                    yield (Note().from_int(x) if x < 128 else None)
+                rest = len(chunks) * hop
+                skip = max(rest - len(data), 0)
+                data = data[rest:]
+    finally:
+        if fp is not file:
+            fp.close()
+    if len(data):
+        yield _short_chunk_note(data[:chunksize], freq, width, window)
+
+def iter_melody(file, chunksize=512, hop=None, window=None, channel=0,
+                block=1 << 16):
+    """Analyze a .wav file while it is read, see iter_chunks, and yield
+    (Note, chunks) tuples like the ones in the list returned by find_melody.
+
+    Every tuple is yielded as soon as a chunk with another Note is found,
+    so the file can be as long as it likes.
+    """
+    note = None
+    count = 0
+    for d in iter_chunks(file, chunksize, hop, window, channel, block):
+        if count and note == d:
+            count += 1
+            continue
+        if count:
+            yield (note, count)
+        (note, count) = (d, 1)
+    if count:
+        yield (note, count)
+
 def find_melody(file='440_480_clean.wav', chunksize=512):
     """Cut the sample into chunks and analyze each chunk.
 
@@ -170,18 +443,7 @@ def find_melody(file='440_480_clean.wav', chunksize=512):
     If two consequent chunks turn out to return the same Note they are
     grouped together.
 
-    This is an experimental function.
+    The file is read and analyzed a block at a time, see iter_melody. This
+    is an experimental function.
     """
-    (data, freq, bits) = data_from_file(file)
-    res = []
-    for d in analyze_chunks(data, freq, bits, chunksize):
-        if res != []:
-            if res[-1][0] == d:
-                val = res[-1][1]
-                res[-1] = (d, val + 1)
-            else:
-                res.append((d, 1))
-        else:
-            res.append((d, 1))
-    return [(x, freq) for (x, freq) in res]
-
+    return list(iter_melody(file, chunksize))
@@ -25,5 +25,9 @@ __all__ = [
     'midi_file_in',
     'midi_file_out',
     'midi_track',
+    'playback_plan',
+    'tempo_map',
+    'transport',
+    'varbyte',
     'fluidsynth',
     ]
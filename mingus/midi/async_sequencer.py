@@ -0,0 +1,330 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+#    mingus - Music theory Python package, async_sequencer module.
+#    Copyright (C) 2008-2009, Bart Spaans
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""A Sequencer that plays on an asyncio event loop.
+
+The play methods of AsyncSequencer don't sleep. They compile what they are
+given into a PlaybackPlan and schedule its events with loop.call_at on the
+clock of the event loop, so that a lot of sequencers can play at the same
+time in a single thread. They return a future that can be awaited:
+
+>>> async def main():
+...     s = MySequencer()
+...     report = await s.play_Composition(composition)
+
+Cancelling the future stops the playback and releases the notes that were
+playing.
+
+Listeners are notified as usual, except that a notify function can also be
+a coroutine function, in which case it is run as a task on the loop. The
+messages can also be read from an asyncio.Queue, see listen.
+
+The background playback of Sequencer.start (and pause, resume, seek,
+set_tempo and loop) is not available: it plays from a thread of its own
+instead of the event loop. Cancel the future to stop playing.
+
+This module needs Python 3.5 or later.
+"""
+
+import asyncio
+from mingus.containers.track import Track
+from mingus.midi.sequencer import Sequencer, timing_report
+from mingus.midi.playback_plan import PlaybackPlan
+
+try:
+    _get_running_loop = asyncio.get_running_loop
+except AttributeError:
+    # Python 3.5 and 3.6, where get_event_loop returns the running loop
+    _get_running_loop = asyncio.get_event_loop
+
+class AsyncSequencer(Sequencer):
+
+    """A Sequencer that schedules its events on an asyncio event loop.
+
+    Subclass it and implement the events (play_event, stop_event, ...) like
+    with Sequencer.
+    """
+
+    def __init__(self, loop=None):
+        """Use loop, or the loop that is running when playback starts."""
+        # Not self.loop, which is the loop method of Sequencer
+        self.event_loop = loop
+        self._playbacks = set()
+        # The running loop found by the last call of get_loop
+        self._last_loop = None
+        Sequencer.__init__(self)
+
+    def get_loop(self):
+        """Return the loop given to __init__ or else the running loop.
+
+        Outside of the loop, the loop that was running when playback last
+        started is returned. Raise a RuntimeError if there is none.
+        """
+        if self.event_loop is not None:
+            return self.event_loop
+        try:
+            self._last_loop = _get_running_loop()
+        except RuntimeError:
+            if self._last_loop is None:
+                raise
+        return self._last_loop
+
+    def clock(self):
+        return self.get_loop().time()
+
+    def notify_listeners(self, msg_type, params):
+        """Send a message to the observers that are subscribed to it.
+
+        Coroutines returned by the notify functions are run as tasks.
+        """
+        listeners = self._get_subscriptions().get(msg_type)
+        if listeners is None:
+            return
+        if callable(params):
+            params = params()
+        for c in listeners:
+            result = c.notify(msg_type, params)
+            if asyncio.iscoroutine(result):
+                asyncio.ensure_future(result, loop=self.get_loop())
+
+    def listen(self, msg_types=None, maxsize=0):
+        """Return an asyncio.Queue that receives (msg_type, params) tuples
+        for the messages with a type in msg_types (all if None).
+
+        If the queue is full, messages are dropped. Use unlisten to stop
+        receiving messages.
+        """
+        listener = _QueueListener(maxsize)
+        self.attach(listener, msg_types)
+        return listener.queue
+
+    def unlisten(self, queue):
+        """Stop sending messages to a queue made by listen."""
+        for listener in self.listeners:
+            if getattr(listener, 'queue', None) is queue:
+                self.detach(listener)
+                return True
+        return False
+
+    def play_Plan(self, plan, loops=1):
+        """Schedule a PlaybackPlan to be played loops times in a row.
+
+        Return a future with the timing report of Sequencer.play_events as
+        its result.
+        """
+        playback = _Playback(self, plan, loops)
+        self._playbacks.add(playback)
+        playback.start()
+        return playback.future
+
+    def play_events(self, events, loops=1, period=None):
+        """Schedule a sorted sequence of events like play_Plan."""
+        if period is None:
+            period = events[-1][0] if len(events) else 0.0
+        playback = _Playback(self, events, loops, period)
+        self._playbacks.add(playback)
+        playback.start()
+        return playback.future
+
+    def play_Composition(self, composition, channels=None, bpm=120):
+        """Schedule a Composition or PlaybackPlan to be played.
+
+        Return a future with a dictionary like the one returned by
+        Sequencer.play_Composition as its result.
+        """
+        self.notify_listeners(self.MSG_PLAY_COMPOSITION, {'composition'
+                              : composition, 'channels': channels, 'bpm': bpm})
+        if not isinstance(composition, PlaybackPlan):
+            composition = self.compile_Composition(composition, channels, bpm)
+        return self._play(composition, bpm)
+
+    def play_Tracks(self, tracks, channels, bpm=120):
+        """Schedule a list of Tracks to be played on the given channels."""
+        self.notify_listeners(self.MSG_PLAY_TRACKS, {'tracks': tracks,
+            'channels': channels, 'bpm': bpm})
+        return self._play(PlaybackPlan(tracks, channels, bpm), bpm)
+
+    def play_Track(self, track, channel=1, bpm=120):
+        """Schedule a Track to be played."""
+        self.notify_listeners(self.MSG_PLAY_TRACK, {'track': track, 'channel'
+                              : channel, 'bpm': bpm})
+        return self._play(PlaybackPlan.from_Track(track, channel, bpm), bpm)
+
+    def play_Bars(self, bars, channels, bpm=120):
+        """Schedule several bars to be played at the same time."""
+        self.notify_listeners(self.MSG_PLAY_BARS, {'bars': bars,
+            'channels': channels, 'bpm': bpm})
+        return self._play(PlaybackPlan([self._bar_track(b) for b in bars],
+                          channels, bpm), bpm)
+
+    def play_Bar(self, bar, channel=1, bpm=120):
+        """Schedule a Bar to be played."""
+        self.notify_listeners(self.MSG_PLAY_BAR, {'bar': bar, 'channel'
+                              : channel, 'bpm': bpm})
+        return self._play(PlaybackPlan.from_Track(self._bar_track(bar),
+                          channel, bpm), bpm)
+
+    def stop(self):
+        """Stop everything that is playing.
+
+        Return False if nothing was playing.
+        """
+        if not self._playbacks:
+            return False
+        for playback in list(self._playbacks):
+            playback.future.cancel()
+        return True
+
+    def start(self, composition, channels=None, bpm=120):
+        raise NotImplementedError('AsyncSequencer plays on the event loop; '
+                                  'use play_Composition instead.')
+
+    def pause(self):
+        raise NotImplementedError('Cancel the future of the playback instead.')
+
+    def resume(self):
+        raise NotImplementedError('Cancel the future of the playback instead.')
+
+    def seek(self, seconds):
+        raise NotImplementedError('Cancel the future of the playback instead.')
+
+    def set_tempo(self, bpm):
+        raise NotImplementedError('Cancel the future of the playback instead.')
+
+    def loop(self, start=None, end=None):
+        raise NotImplementedError('Cancel the future of the playback instead.')
+
+    def _bar_track(self, bar):
+        return Track().add_bar(bar)
+
+    def _play(self, plan, bpm):
+        """Play a plan and return a future with {'bpm': bpm, 'timing':
+        report} as its result."""
+        result = self.get_loop().create_future()
+        playback = self.play_Plan(plan)
+
+        def done(f):
+            if result.done():
+                return
+            if f.cancelled():
+                result.cancel()
+            elif f.exception() is not None:
+                result.set_exception(f.exception())
+            else:
+                result.set_result({'bpm': bpm, 'timing': f.result()})
+
+        def cancelled(f):
+            if f.cancelled():
+                playback.cancel()
+        playback.add_done_callback(done)
+        result.add_done_callback(cancelled)
+        return result
+
+
+class _QueueListener(object):
+
+    def __init__(self, maxsize):
+        self.queue = asyncio.Queue(maxsize)
+
+    def notify(self, msg_type, params):
+        try:
+            self.queue.put_nowait((msg_type, params))
+        except asyncio.QueueFull:
+            pass
+
+
+class _Playback(object):
+
+    """Sends the events of one plan at their times with loop.call_at.
+
+    Only the next event has a callback scheduled; every callback sends all
+    the events that are due and schedules the one after them.
+    """
+
+    def __init__(self, sequencer, events, loops=1, period=None):
+        self.sequencer = sequencer
+        self.loop = sequencer.get_loop()
+        self.events = events
+        self.loops = loops
+        if period is None:
+            period = events.length
+        self.period = period
+        self.future = self.loop.create_future()
+        self.future.add_done_callback(self._done)
+        self.handle = None
+        self.index = 0
+        self.count = 0
+        self.n = 0
+        self.total = 0.0
+        self.total_abs = 0.0
+        self.total_sq = 0.0
+        self.largest = 0.0
+        self.error = 0.0
+
+    def start(self):
+        self.start_time = self.loop.time()
+        self.offset = self.start_time
+        self.step()
+
+    def step(self):
+        self.handle = None
+        if self.future.done():
+            return
+        events = self.events
+        loop = self.loop
+        try:
+            while True:
+                if self.index >= len(events):
+                    self.count += 1
+                    if self.count >= self.loops:
+                        self.future.set_result(timing_report(self.n,
+                                self.total, self.total_abs, self.total_sq,
+                                self.largest, self.error, loop.time()
+                                - self.start_time))
+                        return
+                    self.index = 0
+                    self.offset += self.period
+                    if not len(events):
+                        continue
+                event = events[self.index]
+                at = event[0] + self.offset
+                now = loop.time()
+                if at > now:
+                    self.handle = loop.call_at(at, self.step)
+                    return
+                error = now - at
+                self.n += 1
+                self.total += error
+                self.total_abs += abs(error)
+                self.total_sq += error * error
+                if abs(error) > self.largest:
+                    self.largest = abs(error)
+                self.error = error
+                self.index += 1
+                self.sequencer.send_event(*event[1:])
+        except Exception as e:
+            self.future.set_exception(e)
+
+    def _done(self, future):
+        self.sequencer._playbacks.discard(self)
+        if self.handle is not None:
+            self.handle.cancel()
+            self.handle = None
+        if future.cancelled():
+            self.sequencer.stop_everything()
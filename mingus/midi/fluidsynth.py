@@ -32,8 +32,14 @@ Now you are ready to play Notes, NoteContainers, etc.
 """
 
 from mingus.midi.sequencer import Sequencer
+from mingus.midi.playback_plan import PlaybackPlan, EVENT_INSTR, \
+     EVENT_PLAY, EVENT_STOP
 from mingus.containers.instrument import MidiInstrument
+from mingus.containers.bar import Bar
+from mingus.containers.track import Track
 from . import pyfluidsynth as fs
+from collections import deque
+import threading
 import time
 import wave
 
@@ -42,6 +48,7 @@ class FluidSynthSequencer(Sequencer):
     """A simple MidiSequencer for FluidSynth."""
 
     output = None
+    samplerate = 44100
 
     def init(self):
         self.fs = fs.Synth()
@@ -63,8 +70,9 @@ class FluidSynthSequencer(Sequencer):
         w = wave.open(file, 'wb')
         w.setnchannels(2)
         w.setsampwidth(2)
-        w.setframerate(44100)
+        w.setframerate(self.samplerate)
         self.wav = w
+        self.recorded = 0.0
 
     def load_sound_font(self, sf2):
         """Load a sound font.
@@ -92,12 +100,279 @@ class FluidSynthSequencer(Sequencer):
 
     def sleep(self, seconds):
         if hasattr(self, 'wav'):
-            samples = fs.raw_audio_string(self.fs.get_samples(
-                int(seconds * 44100)))
-            self.wav.writeframes(samples)
+            # Round the total instead of every gap, so that the recording
+            # doesn't drift
+            self.recorded += seconds
+            frames = int(round(self.recorded * self.samplerate))\
+                 - self.wav.tell()
+            if frames > 0:
+                samples = fs.raw_audio_string(self.fs.get_samples(frames))
+                self.wav.writeframes(samples)
         else:
             time.sleep(seconds)
 
+    def clock(self):
+        # When recording, time is the length of the audio recorded so far.
+        if hasattr(self, 'wav'):
+            return self.recorded
+        return Sequencer.clock(self)
+
+    @property
+    def realtime(self):
+        return not hasattr(self, 'wav')
+
+    def render_Composition(self, composition, file, channels=None, bpm=120,
+                           block_size=1024, tail=1.0, buffer_size=1 << 20):
+        """Render a Composition or PlaybackPlan to a wave file as fast as
+        possible.
+
+        A sound font must have been loaded, but the audio output doesn't
+        have to be started. The file can be a file name or a file object.
+
+        The audio is rendered in blocks of at most block_size frames. Every
+        event is sent at the frame nearest to its time, counted from the
+        start of the file, so that no timing error builds up. The audio is
+        rendered straight into a preallocated buffer of buffer_size bytes,
+        which is written to the file whenever it is full. After the end of
+        the plan (see PlaybackPlan.length), tail seconds are rendered to
+        let the notes ring out.
+
+        Return a dictionary with the number of 'frames' rendered, the
+        length of the audio in 'seconds', the 'elapsed' time in seconds and
+        the 'realtime_factor': the length of the audio divided by the time
+        it took to render it.
+        """
+        if not isinstance(composition, PlaybackPlan):
+            composition = self.compile_Composition(composition, channels, bpm)
+        start = time.time()
+        rate = self.samplerate
+        w = wave.open(file, 'wb')
+        w.setnchannels(2)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        out = _BufferedWave(w, self.fs.get_samples, max(buffer_size // 4,
+                            block_size))
+        try:
+            pos = self.render_plan(composition, out.render, block_size, tail)
+            out.flush()
+        finally:
+            w.close()
+        elapsed = max(time.time() - start, 1e-9)
+        seconds = pos / float(rate)
+        return {
+            'frames': pos,
+            'seconds': seconds,
+            'elapsed': elapsed,
+            'realtime_factor': seconds / elapsed,
+            }
+
+    def render_plan(self, plan, render, block_size=1024, tail=1.0,
+                    frames=None):
+        """Send the events of a PlaybackPlan at the right frames while
+        rendering the audio in between with render(n), which should render
+        n frames, with n at most block_size.
+
+        Render tail seconds after the end of the plan (see
+        PlaybackPlan.length), or exactly frames frames if given. Return the
+        number of rendered frames.
+        """
+        rate = self.samplerate
+        pos = 0
+        for (at, kind, channel, param1, param2) in plan:
+            frame = int(round(at * rate))
+            while pos < frame:
+                n = min(block_size, frame - pos)
+                render(n)
+                pos += n
+            self.send_event(kind, channel, param1, param2)
+        if frames is None:
+            frames = max(pos, int(round(plan.length * rate)))\
+                 + int(round(tail * rate))
+        while pos < frames:
+            n = min(block_size, frames - pos)
+            render(n)
+            pos += n
+        return pos
+
+
+class _BufferedWave(object):
+
+    """Renders stereo 16-bit audio into a preallocated array of frames
+    frames and writes it to a wave file whenever it is full."""
+
+    def __init__(self, wav, get_samples, frames):
+        import numpy
+        self.wav = wav
+        self.get_samples = get_samples
+        self.buffer = numpy.empty(frames * 2, dtype=numpy.int16)
+        self.filled = 0
+
+    def render(self, n):
+        """Let get_samples(n, out) write n frames into the buffer."""
+        if (self.filled + n) * 2 > len(self.buffer):
+            self.flush()
+        self.get_samples(n, self.buffer[self.filled * 2:])
+        self.filled += n
+
+    def flush(self):
+        if self.filled:
+            # writeframesraw doesn't update the header; close does
+            self.wav.writeframesraw(self.buffer[:self.filled * 2].data)
+            self.filled = 0
+
+
+class FluidSynthScheduler(object):
+
+    """Plays PlaybackPlans through FluidSynth's own sequencer.
+
+    The events are handed to the sequencer of FluidSynth (see
+    pyfluidsynth.Sequencer) with their time in ticks, which sends them to
+    the synthesizer itself. Notes whose start and end are known become a
+    single 'note' event. Only the events in the next lookahead seconds are
+    scheduled at a time; a timer event halfway through every batch calls
+    back to schedule the next one, so Python only has to run once in a
+    while and its timing doesn't affect the music.
+    """
+
+    def __init__(self, sequencer=None, lookahead=0.5, time_scale=1000,
+                 use_system_timer=False):
+        """Schedule the events for the synthesizer of sequencer, a
+        FluidSynthSequencer (by default the one of this module).
+
+        With use_system_timer False, FluidSynth's sequencer follows the
+        audio that is rendered instead of the system clock.
+        """
+        if sequencer is None:
+            sequencer = midi
+        self.sequencer = sequencer
+        self.lookahead = lookahead
+        self.time_scale = time_scale
+        self.fs_seq = fs.Sequencer(time_scale, use_system_timer)
+        self.synth_id = self.fs_seq.register_fluidsynth(sequencer.fs)
+        self.client_id = self.fs_seq.register_client('mingus',
+                self._callback)
+        self.events = []
+        self.index = 0
+        self.start_tick = 0
+        self.end = 0
+        self.batches = 0
+        self.stopped = True
+        self.lock = threading.Lock()
+
+    def compile(self, plan):
+        """Return the events of a PlaybackPlan as a list of (tick, kind,
+        channel, note, velocity, duration) tuples, where kind is 'note',
+        'note_on' or 'note_off' and tick and duration are relative to the
+        start of the plan. The instrument events are left out."""
+        scale = self.time_scale
+        events = []
+        started = {}
+        for (at, kind, channel, param1, param2) in plan:
+            tick = int(round(at * scale))
+            if kind == EVENT_PLAY:
+                started.setdefault((channel, param1), deque()).append(
+                        len(events))
+                events.append((tick, 'note_on', channel, param1, param2, 0))
+            elif kind == EVENT_STOP:
+                waiting = started.get((channel, param1))
+                if waiting:
+                    i = waiting.popleft()
+                    e = events[i]
+                    events[i] = (e[0], 'note', channel, param1, e[4], tick
+                                 - e[0])
+                else:
+                    events.append((tick, 'note_off', channel, param1, 0, 0))
+        events.sort(key=lambda e: e[0])
+        return events
+
+    def play(self, music, channels=None, bpm=120, delay=0.05):
+        """Start playing a Bar, Track, Composition or PlaybackPlan delay
+        seconds from now and return at once."""
+        if isinstance(music, Bar):
+            music = Track().add_bar(music)
+        if isinstance(music, Track):
+            music = PlaybackPlan.from_Track(music, (channels or [1])[0], bpm)
+        elif not isinstance(music, PlaybackPlan):
+            music = PlaybackPlan.from_Composition(music, channels, bpm)
+        self.stop()
+        for (at, kind, channel, param1, param2) in music:
+            if kind == EVENT_INSTR:
+                self.sequencer.set_instrument(channel, param1, param2)
+        events = self.compile(music)
+        self.lock.acquire()
+        try:
+            self.events = events
+            self.index = 0
+            self.batches = 0
+            self.end = max([e[0] + e[5] for e in events] or [0])
+            self.start_tick = self.fs_seq.get_tick() + int(round(delay
+                    * self.time_scale))
+            self.stopped = False
+            self._schedule_batch()
+        finally:
+            self.lock.release()
+        return self
+
+    def playing(self):
+        """Return True until the last event has been sent."""
+        if self.stopped or not self.events:
+            return False
+        return self.index < len(self.events) or self.fs_seq.get_tick()\
+             < self.start_tick + self.end
+
+    def stop(self):
+        """Remove the events that have been scheduled but not sent and stop
+        the notes on all channels."""
+        self.lock.acquire()
+        try:
+            self.stopped = True
+            self.events = []
+            self.index = 0
+        finally:
+            self.lock.release()
+        # FluidSynth holds its own lock while it calls back, so the events
+        # are removed without holding ours
+        self.fs_seq.remove_events()
+        for channel in range(16):
+            self.sequencer.fs.cc(channel, 123, 0)
+
+    def _schedule_batch(self):
+        """Schedule the events up to lookahead seconds after the current
+        tick, and a timer to schedule the next batch. The lock has to be
+        held."""
+        events = self.events
+        seq = self.fs_seq
+        dest = self.synth_id
+        start = self.start_tick
+        window = max(seq.get_tick() - start, 0) + int(self.lookahead
+                * self.time_scale)
+        i = self.index
+        while i < len(events) and events[i][0] < window:
+            (tick, kind, channel, note, velocity, duration) = events[i]
+            if kind == 'note':
+                seq.note(start + tick, channel, note, velocity, duration,
+                         dest=dest)
+            elif kind == 'note_on':
+                seq.note_on(start + tick, channel, note, velocity, dest=dest)
+            else:
+                seq.note_off(start + tick, channel, note, dest=dest)
+            i += 1
+        self.index = i
+        self.batches += 1
+        if i < len(events):
+            seq.timer(start + window - int(self.lookahead * self.time_scale
+                      / 2), dest=self.client_id)
+
+    def _callback(self, time, event, seq, data):
+        # Called from FluidSynth's thread, so stop() can't change the events
+        # while the batch is scheduled
+        self.lock.acquire()
+        try:
+            if not self.stopped and self.index < len(self.events):
+                self._schedule_batch()
+        finally:
+            self.lock.release()
+
 
 midi = FluidSynthSequencer()
 initialized = False
@@ -185,6 +460,165 @@ def play_Composition(composition, channels=None, bpm=120):
     """Play a composition."""
     return midi.play_Composition(composition, channels, bpm)
 
+def render_Composition(composition, file, channels=None, bpm=120):
+    """Render a composition to a wave file, faster than real time.
+
+    The sound font has to be loaded with init first. Return a dictionary
+    with the 'realtime_factor' and other statistics, see
+    FluidSynthSequencer.render_Composition.
+    """
+    return midi.render_Composition(composition, file, channels, bpm)
+
+def render_Composition_parallel(composition, file, sf2, channels=None,
+                                bpm=120, gains=None, pans=None,
+                                processes=None, tail=1.0, block_size=1024,
+                                stems=None):
+    """Render every track of a composition in its own worker process and
+    mix them down to a 16-bit wave file.
+
+    Every worker loads the sound font sf2 in its own synthesizer, so init
+    doesn't have to be called first. The tracks are rendered as 32-bit
+    float stems to temporary files, which are mixed in blocks with the
+    given lists of gains (default 1.0) and pans (-1.0 is left, 0.0, the
+    default, is center and 1.0 is right). If stems is a list of file
+    names, every stem is also written to its own wave file.
+
+    Return a dictionary like render_Composition does, with the 'peak'
+    absolute sample value of the mix, the number of samples that were
+    'clipped' to fit the output, and the 'stem_peaks'.
+
+    Where multiprocessing can't spawn new interpreters the workers are
+    forked, so a RuntimeError is raised while the audio output of the
+    module synthesizer is running.
+    """
+    import multiprocessing
+    import numpy
+    import os
+    import tempfile
+    start = time.time()
+    if channels == None:
+        channels = list(map(lambda x: x + 1, range(len(composition.tracks))))
+    tracks = composition.tracks
+    n = len(tracks)
+    gains = gains or [1.0] * n
+    pans = pans or [0.0] * n
+
+    # Use the tempo of the whole composition in every stem and make all the
+    # stems the same length
+    plan = PlaybackPlan.from_Composition(composition, channels, bpm)
+    if not hasattr(multiprocessing, 'get_context') and \
+            midi.fs.audio_driver is not None:
+        # A forked worker would inherit the synthesizer while the audio
+        # driver thread is using it
+        raise RuntimeError("Can't render in parallel while the audio output "
+                           'is running.')
+    rate = FluidSynthSequencer.samplerate
+    frames = int(round(plan.length * rate)) + int(round(tail * rate))
+    jobs = []
+    for (track, channel) in zip(tracks, channels):
+        (fd, name) = tempfile.mkstemp(suffix='.f32')
+        os.close(fd)
+        jobs.append((PlaybackPlan([track], [channel], bpm, plan.tempo_map),
+                    sf2, frames, block_size, name))
+    if hasattr(multiprocessing, 'get_context'):
+        # Start fresh interpreters instead of forking the module synthesizer
+        pool = multiprocessing.get_context('spawn').Pool(processes)
+    else:
+        pool = multiprocessing.Pool(processes)
+    try:
+        stem_peaks = pool.map(_render_stem, jobs)
+        pool.close()
+        pool.join()
+        w = wave.open(file, 'wb')
+        w.setnchannels(2)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        peak = 0.0
+        clipped = 0
+        stem_files = []
+        sources = []
+        try:
+            for job in jobs:
+                sources.append(numpy.memmap(job[-1], numpy.float32, 'r',
+                               shape=(frames, 2)))
+            for name in stems or []:
+                s = wave.open(name, 'wb')
+                s.setnchannels(2)
+                s.setsampwidth(2)
+                s.setframerate(rate)
+                stem_files.append(s)
+            # Balance: the opposite side is turned down, the center keeps
+            # both sides at full level
+            balance = [numpy.array([min(1.0, 1.0 - p), min(1.0, 1.0 + p)],
+                       numpy.float32) * g for (g, p) in zip(gains, pans)]
+            mix = numpy.empty((min(frames, 65536), 2), numpy.float32)
+            for pos in range(0, frames, len(mix)):
+                end = min(pos + len(mix), frames)
+                block = mix[:end - pos]
+                block.fill(0.0)
+                for (i, source) in enumerate(sources):
+                    block += source[pos:end] * balance[i]
+                    if i < len(stem_files):
+                        stem_files[i].writeframesraw(_to_s16(source[pos:end],
+                                numpy)[0].tobytes())
+                (data, over, top) = _to_s16(block, numpy)
+                clipped += over
+                peak = max(peak, top)
+                w.writeframesraw(data.tobytes())
+        finally:
+            # Drop the memmaps, which closes them, before the files are
+            # removed
+            del sources[:]
+            w.close()
+            for s in stem_files:
+                s.close()
+    finally:
+        pool.terminate()
+        for job in jobs:
+            os.remove(job[-1])
+    elapsed = max(time.time() - start, 1e-9)
+    seconds = frames / float(rate)
+    return {
+        'frames': frames,
+        'seconds': seconds,
+        'elapsed': elapsed,
+        'realtime_factor': seconds / elapsed,
+        'peak': peak,
+        'clipped': clipped,
+        'stem_peaks': stem_peaks,
+        }
+
+def _to_s16(samples, numpy):
+    """Convert float samples to 16-bit integers. Return the integers, the
+    number of samples that had to be clipped and the peak absolute value."""
+    if not len(samples):
+        return (numpy.zeros(0, numpy.int16), 0, 0.0)
+    magnitude = numpy.abs(samples)
+    over = int(numpy.count_nonzero(magnitude > 1.0))
+    data = numpy.clip(samples, -1.0, 1.0) * 32767.0
+    return (data.astype(numpy.int16), over, float(magnitude.max()))
+
+def _render_stem(args):
+    """Render a PlaybackPlan with a new synthesizer into a file of float32
+    frames and return the peak absolute sample value; used by
+    render_Composition_parallel."""
+    import numpy
+    (plan, sf2, frames, block_size, name) = args
+    seq = FluidSynthSequencer()
+    if not seq.load_sound_font(sf2):
+        raise IOError("Couldn't load sound font '%s'" % sf2)
+    seq.fs.program_reset()
+    out = numpy.memmap(name, numpy.float32, 'w+', shape=(frames * 2,))
+    pos = [0]
+    get_samples = seq.fs.get_samples_float
+
+    def render(n):
+        get_samples(n, out[pos[0] * 2:])
+        pos[0] += n
+    seq.render_plan(plan, render, block_size, frames=frames)
+    out.flush()
+    return float(numpy.abs(out).max())
+
 def control_change(channel, control, value):
     """Send a control change event on channel."""
     return midi.control_change(channel, control, value)
@@ -193,9 +627,13 @@ def set_instrument(channel, midi_instr):
     """Set the midi instrument on channel."""
     return midi.set_instrument(channel, midi_instr)
 
-def stop_everything():
-    """Stop all the playing notes on all channels."""
-    return midi.stop_everything()
+def stop_everything(all_notes_off=False):
+    """Stop all the playing notes on all channels.
+
+    If all_notes_off is True, an All Notes Off control change is sent to
+    every channel instead of stopping the notes one by one.
+    """
+    return midi.stop_everything(all_notes_off)
 
 def modulation(channel, value):
     return midi.modulation(channel, value)
@@ -25,9 +25,25 @@ from mingus.containers.bar import Bar
 from mingus.containers.track import Track
 from mingus.containers.composition import Composition
 from mingus.containers.instrument import MidiInstrument
+from mingus.midi.tempo_map import TempoMap
+from mingus.midi import varbyte
 import mingus.core.notes as notes
 import mingus.core.intervals as intervals
 import binascii
+import collections
+import fractions
+import fnmatch
+import glob
+import heapq
+import itertools
+import multiprocessing
+import os
+import struct
+import time
+try:
+    _string_types = basestring
+except NameError:
+    _string_types = str
 
 def MIDI_to_Composition(file):
     """Convert a MIDI file to a mingus.containers.Composition and return it
@@ -40,6 +56,57 @@ def MIDI_to_Composition(file):
     m = MidiFile()
     return m.MIDI_to_Composition(file)
 
+def iter_events(file, track=None, merge=False):
+    """Generate (track_number, tick, event) tuples for the events in a MIDI
+    file, without parsing the whole file into lists first.
+
+    Set merge to True to merge the tracks in order of absolute tick, or set
+    track to the number of the only track you are interested in.
+
+    See MidiFile.iter_events for more information.
+    """
+    m = MidiFile()
+    return m.iter_events(file, track, merge)
+
+def MIDI_to_arrays(file):
+    """Parse a MIDI file into NumPy structured arrays, one per track.
+
+    Return the header and a list of (events, meta) tuples. The events array
+    has the fields in EVENT_DTYPE: the absolute tick, the delta time, the
+    event type, the channel and the two parameters. meta maps the indices
+    of the meta events to their payloads.
+
+    This makes statistics over lots of events cheap, for instance:
+    >>> (header, tracks) = MIDI_to_arrays('song.mid')
+    >>> (events, meta) = tracks[0]
+    >>> pitches = events['p1'][events['type'] == 9]
+    >>> numpy.bincount(pitches, minlength=128)
+
+    This function needs NumPy.
+    """
+    m = MidiFile()
+    return m.parse_midi_file_arrays(file)
+
+def MIDI_files_to_Compositions(files, processes=None, ordered=True):
+    """Convert a directory, glob pattern or list of MIDI files to
+    Compositions using a pool of worker processes.
+
+    Generate (file, composition, bpm) tuples. Files that can't be converted
+    are skipped; use MidiFileBatch directly to get at the errors and the
+    throughput.
+    """
+    return iter(MidiFileBatch(files, processes, ordered=ordered))
+
+# The fields of the structured arrays returned by MIDI_to_arrays
+EVENT_DTYPE = [
+    ('tick', 'i8'),
+    ('delta', 'u4'),
+    ('type', 'u1'),
+    ('channel', 'u1'),
+    ('p1', 'u1'),
+    ('p2', 'u1'),
+    ]
+
 class HeaderError(Exception):
     pass
 
@@ -62,111 +129,230 @@ class MidiFile:
     bytes_read = 0
 
     def MIDI_to_Composition(self, file):
-        (header, track_data) = self.parse_midi_file(file)
+        (header, track_data) = self.parse_midi_file_buffered(file)
+        return self.track_data_to_Composition(header, track_data)
+
+    def track_data_to_Composition(self, header, track_data):
+        """Convert a header and track data, as returned by parse_midi_file,
+        to a Composition and return it together with the last tempo.
+
+        The tempo changes of the first track, which is where format 0 and 1
+        files keep them, are collected in a TempoMap that is set as the
+        tempo_map attribute of the Composition. A first track of a format 1
+        file that only contains meta events (a conductor track, like the
+        one written by midi_file_out.write_Composition) doesn't become a
+        Track. The tracks of format 2 files are independent sequences:
+        every Track gets a tempo_map attribute of its own, and the one of
+        the first track is used for the Composition.
+        """
         c = Composition()
+        self.bpm = MidiFile.bpm
         if header[2]['fps']:
             print "Don't know how to parse this yet"
-            return c
+            return (c, self.bpm)
         ticks_per_beat = header[2]['ticks_per_beat']
-        for track in track_data:
-            t = Track()
-            b = Bar()
-            metronome = 1  # Tick once every quarter note
-            thirtyseconds = 8  # 8 thirtyseconds in a quarter note
-            meter = (4, 4)
-            key = 'C'
-            for e in track:
-                (deltatime, event) = e
-                duration = float(deltatime) / (ticks_per_beat * 4.0)
-                if duration != 0.0:
-                    duration = 1.0 / duration
-                    if len(b.bar) > 0:
-                        current_length = b.bar[-1][1]
-                        b.bar[-1][1] = duration
-                        if current_length - duration != 0:
-                            b.current_beat -= 1.0 / current_length
-                            b.current_beat += 1.0 / duration
-                    if not b.place_notes(NoteContainer(), duration):
-                        t + b
-                        b = Bar(key, meter)
-                        b.place_notes(NoteContainer(), duration)
-
-                if event['event'] == 8:
-                    if deltatime == 0:
-                        pass
-                elif event['event'] == 9:
-                    # note on
-                    n = Note(notes.int_to_note(event['param1'] % 12),
-                             event['param1'] / 12 - 1)
-                    n.channel = event['channel']
-                    n.velocity = event['param2']
-                    if len(b.bar) > 0:
-                        b.bar[-1][2] + n
-                    else:
-                        b + n
-                elif event['event'] == 10:
-                    # note aftertouch
+        self.tempo_map = TempoMap(ticks_per_beat, self.bpm)
+        c.tempo_map = self.tempo_map
+        for (i, track) in enumerate(track_data):
+            if header[0] == 2 and i > 0:
+                self.tempo_map = TempoMap(ticks_per_beat, MidiFile.bpm)
+            t = self.track_events_to_Track(track, ticks_per_beat, i == 0
+                    or header[0] == 2)
+            if header[0] == 2:
+                t.tempo_map = self.tempo_map
+            elif i == 0 and header[0] == 1 and self._is_conductor(track):
+                continue
+            c.tracks.append(t)
+        self.tempo_map = c.tempo_map
+        return (c, self.bpm)
+
+    def _is_conductor(self, track):
+        """Return True if the [delta_time, event] pairs of a track are all
+        meta events."""
+        for (delta_time, event) in track:
+            if event['event'] != 0x0f:
+                return False
+        return True
+
+    def track_events_to_Track(self, track, ticks_per_beat, tempo=True):
+        """Convert the [delta_time, event] pairs of one track to a Track.
+
+        The Set Tempo events are added to self.tempo_map if tempo is True and
+        ignored otherwise.
+
+        Note on and note off events are paired per channel and pitch. Every
+        tick at which notes start becomes a NoteContainer lasting until the
+        longest of its notes ends or the next NoteContainer starts, with
+        rests filling the gaps; notes at the last tick that are never
+        released last until the end of their bar. All the positions are
+        kept in integer ticks and only converted to beats and durations per
+        NoteContainer, so rounding errors don't add up over long tracks.
+        """
+        t = Track()
+        whole_note = ticks_per_beat * 4
+
+        # Collect the NoteContainers as [tick, notes, end tick] slots and the
+        # changes of meter and key that influence the bars as (tick, meter,
+        # key) tuples.
+        slots = []
+        changes = []
+        sounding = {}
+        meter = (4, 4)
+        key = 'C'
+        tick = 0
+        for (deltatime, event) in track:
+            tick += deltatime
+            event_type = event['event']
+            if event_type == 9 and event['param2'] > 0:
+                # note on
+                if not slots or slots[-1][0] != tick:
+                    slots.append([tick, [], tick])
+                n = Note(notes.int_to_note(event['param1'] % 12),
+                         event['param1'] // 12 - 1)
+                n.channel = event['channel']
+                n.velocity = event['param2']
+                slots[-1][1].append(n)
+                k = (event['channel'], event['param1'])
+                if k in sounding:
+                    sounding[k].append(slots[-1])
+                else:
+                    sounding[k] = collections.deque([slots[-1]])
+            elif event_type == 8 or event_type == 9:
+                # note off, or note on with velocity 0
+                started = sounding.get((event['channel'], event['param1']))
+                if started:
+                    slot = started.popleft()
+                    if tick > slot[2]:
+                        slot[2] = tick
+            elif event_type == 10:
+                # note aftertouch
+                pass
+            elif event_type == 11:
+                # controller select
+                pass
+            elif event_type == 12:
+                # program change
+                i = MidiInstrument()
+                i.instrument_nr = event['param1']
+                t.instrument = i
+            elif event_type == 0x0f:
+                # meta event Text
+                if event['meta_event'] == 1:
                     pass
-                elif event['event'] == 11:
-                    # controller select
+                elif event['meta_event'] == 3:
+                    # Track name
+                    t.name = event['data']
+                elif event['meta_event'] == 6:
+                    # Marker
                     pass
-                elif event['event'] == 12:
-                    # program change
-                    i = MidiInstrument()
-                    i.instrument_nr = event['param1']
-                    t.instrument = i
-                elif event['event'] == 0x0f:
-                    # meta event Text
-                    if event['meta_event'] == 1:
-                        pass
-                    elif event['meta_event'] == 3:
-                        # Track name
-                        t.name = event['data']
-                    elif event['meta_event'] == 6:
-                        # Marker
-                        pass
-                    elif event['meta_event'] == 7:
-                        # Cue Point
-                        pass
-                    elif event['meta_event'] == 47:
-                        # End of Track
-                        pass
-                    elif event['meta_event'] == 81:
-                        # Set tempo warning Only the last change in bpm will get
-                        # saved currently
+                elif event['meta_event'] == 7:
+                    # Cue Point
+                    pass
+                elif event['meta_event'] == 47:
+                    # End of Track
+                    pass
+                elif event['meta_event'] == 81:
+                    # Set tempo
+                    if tempo:
                         mpqn = self.bytes_to_int(event['data'])
-                        bpm = 60000000 / mpqn
-                    elif event['meta_event'] == 88:
-                        # Time Signature
-                        d = event['data']
-                        thirtyseconds = self.bytes_to_int(d[3])
-                        metronome = self.bytes_to_int(d[2]) / 24.0
-                        denom = 2 ** self.bytes_to_int(d[1])
-                        numer = self.bytes_to_int(d[0])
-                        meter = (numer, denom)
-                        b.set_meter(meter)
-                    elif event['meta_event'] == 89:
-                        # Key Signature
-                        d = event['data']
-                        sharps = self.bytes_to_int(d[0])
-                        minor = self.bytes_to_int(d[0])
-                        if minor:
-                            key = 'A'
-                        else:
-                            key = 'C'
-                        for i in xrange(abs(sharps)):
-                            if sharps < 0:
-                                key = intervals.major_fourth(key)
-                            else:
-                                key = intervals.major_fifth(key)
-                        b.key = Note(key)
+                        self.tempo_map.set_tempo(tick, mpqn)
+                        self.bpm = 60000000 / mpqn
+                elif event['meta_event'] == 88:
+                    # Time Signature
+                    d = event['data']
+                    denom = 2 ** self.bytes_to_int(d[1])
+                    numer = self.bytes_to_int(d[0])
+                    meter = (numer, denom)
+                    changes.append((tick, meter, key))
+                elif event['meta_event'] == 89:
+                    # Key Signature
+                    d = event['data']
+                    sharps = self.bytes_to_int(d[0])
+                    if sharps > 127:
+                        sharps -= 256
+                    minor = self.bytes_to_int(d[1])
+                    if minor:
+                        key = 'A'
                     else:
-                        print 'Unsupported META event', event['meta_event']
+                        key = 'C'
+                    for i in xrange(abs(sharps)):
+                        if sharps < 0:
+                            key = intervals.major_fourth(key)
+                        else:
+                            key = intervals.major_fifth(key)
+                    changes.append((tick, meter, key))
                 else:
-                    print 'Unsupported MIDI event', event
-            t + b
-            c.tracks.append(t)
-        return (c, bpm)
+                    print 'Unsupported META event', event['meta_event']
+            else:
+                print 'Unsupported MIDI event', event
+
+        # Fill the bars. Changes of meter and key are applied to the bar that
+        # starts at or after their tick.
+        changes.reverse()
+        meter = (4, 4)
+        key = 'C'
+        bar_start = 0
+        b = None
+        pos = 0
+        slots.append([tick, None, tick])
+        for x in xrange(len(slots)):
+            (start, note_list, end) = slots[x]
+            segments = []
+            if pos < start:
+                segments.append((pos, start, NoteContainer()))
+                pos = start
+            if note_list is not None:
+                next_start = slots[x + 1][0]
+                if end <= start and next_start <= start:
+                    # Notes at the last tick that are never released, like
+                    # the last hit of a drum track, last until the end of
+                    # their bar
+                    end = None
+                elif end <= start or end > next_start:
+                    end = next_start
+                if end is None:
+                    segments.append((start, end, NoteContainer(note_list)))
+                elif end > start:
+                    segments.append((start, end, NoteContainer(note_list)))
+                    pos = end
+            for (start, end, nc) in segments:
+                while end is None or start < end:
+                    if b is None or (bar_length and start >= bar_start
+                                     + bar_length):
+                        if b is not None:
+                            t + b
+                            bar_start += bar_length
+                        while changes and changes[-1][0] <= bar_start:
+                            (tick, meter, key) = changes.pop()
+                        b = Bar(key, meter)
+                        bar_length = (whole_note * meter[0]) / meter[1]
+                        if (whole_note * meter[0]) % meter[1]:
+                            bar_length = fractions.Fraction(whole_note
+                                    * meter[0], meter[1])
+                        continue
+                    if end is None:
+                        end = bar_start + bar_length
+                        if not bar_length:
+                            end = start + ticks_per_beat
+                    if bar_length:
+                        part_end = min(end, bar_start + bar_length)
+                    else:
+                        part_end = end
+
+                    # Notes that don't fit in the bar are cut off at the
+                    # barline and the rest of their duration becomes a rest.
+                    b.bar.append([float(start - bar_start) / whole_note,
+                                 float(whole_note) / (part_end - start), nc])
+                    b.current_beat = float(part_end - bar_start) / whole_note
+                    start = part_end
+                    if start < end:
+                        nc = NoteContainer()
+        if b is None:
+            while changes:
+                (tick, meter, key) = changes.pop()
+            b = Bar(key, meter)
+        t + b
+        return t
 
     def parse_midi_file_header(self, fp):
         """Read the header of a MIDI file and return a tuple containing the
@@ -363,29 +549,499 @@ class MidiFile:
         f.close()
         return (header, result)
 
+    def parse_midi_file_buffered(self, file):
+        """Parse a MIDI file by reading it into memory in one go.
+
+        Return the same (header, track_data) tuple as parse_midi_file, but
+        decode the chunks from an in-memory buffer with integer indexing
+        instead of reading the file byte by byte.
+        """
+        return self.parse_midi_data(self.read_midi_data(file))
+
+    def read_midi_data(self, file):
+        """Read a whole MIDI file and return its contents as a bytearray."""
+        try:
+            f = open(file, 'rb')
+        except:
+            raise IOError('File not found')
+        try:
+            return bytearray(f.read())
+        except:
+            raise IOError("Couldn't read from file.")
+        finally:
+            f.close()
+
+    def parse_midi_data(self, data):
+        """Parse MIDI data that has already been read into memory.
+
+        The data should be a buffer that returns integers when indexed, like
+        a bytearray. Return the header and the parsed track data, just like
+        parse_midi_file.
+        """
+        (header, chunks) = self.scan_midi_data(data)
+        return (header, [self.parse_track_data(data, start, end) for (start,
+                end) in chunks])
+
+    def scan_midi_data(self, data):
+        """Check the header and the track chunk headers in data.
+
+        Return the header and a list of (start, end) tuples with the offsets
+        of the event data of every track.
+        """
+        self.bytes_read = 0
+        (header, pos) = self.parse_midi_data_header(data)
+        chunks = []
+        for i in xrange(header[1]):
+            (start, end) = self.parse_track_data_header(data, pos)
+            if end > len(data):
+                raise IOError('Track chunk at byte %d runs past the end of '
+                        'the data.' % pos)
+            chunks.append((start, end))
+            pos = end
+        self.bytes_read = pos
+        return (header, chunks)
+
+    def parse_midi_data_header(self, data):
+        """Parse the header chunk at the start of data.
+
+        Return a tuple containing the header -like parse_midi_file_header-
+        and the offset of the first track chunk.
+        """
+        if len(data) < 14 or data[0:4] != b'MThd':
+            raise HeaderError('Not a valid MIDI file header. Byte 0.')
+        (chunk_size, format_type, number_of_tracks) = struct.unpack_from(
+                '>LHH', data, 4)
+        if chunk_size < 6:
+            raise HeaderError('Invalid header chunk size %d. Byte 4.'
+                    % chunk_size)
+        if format_type not in [0, 1, 2]:
+            raise FormatError('%d is not a valid MIDI format.' % format_type)
+        time_division = self.parse_time_division(bytes(data[12:14]))
+        return ((format_type, number_of_tracks, time_division),
+                8 + chunk_size)
+
+    def parse_track_data_header(self, data, pos):
+        """Check the track chunk header at offset pos.
+
+        Return the offsets of the first and one past the last byte of the
+        track's event data. The caller should check that the event data
+        actually fits in the buffer.
+        """
+        if data[pos:pos + 4] != b'MTrk':
+            raise HeaderError('Not a valid Track header. Byte %d.' % pos)
+        try:
+            (chunk_size,) = struct.unpack_from('>L', data, pos + 4)
+        except struct.error:
+            raise IOError("Couldn't read track chunk size. Byte %d."
+                    % (pos + 4))
+        start = pos + 8
+        return (start, start + chunk_size)
+
+    def parse_track_data(self, data, pos, end):
+        """Parse the events between the offsets pos and end of data.
+
+        Return a list of [delta_time, event] pairs in the same format as
+        parse_track.
+        """
+        return list(self.iter_track_data(data, pos, end))
+
+    def iter_track_data(self, data, pos, end):
+        """Generate the [delta_time, event] pairs between the offsets pos and
+        end of data, one event at a time."""
+        for (delta_time, event_type, channel, param1, param2,
+             meta_data) in self.iter_raw_track_data(data, pos, end):
+            if event_type == 0x0f:
+                yield [delta_time, {'event': event_type, 'meta_event':
+                       param1, 'data': meta_data}]
+            elif event_type in (12, 13):
+                yield [delta_time, {'event': event_type, 'channel': channel,
+                       'param1': param1}]
+            else:
+                yield [delta_time, {'event': event_type, 'channel': channel,
+                       'param1': param1, 'param2': param2}]
+
+    def iter_raw_track_data(self, data, pos, end):
+        """Generate the events between the offsets pos and end of data as
+        plain (delta_time, event_type, channel, param1, param2, meta_data)
+        tuples.
+
+        For meta events param1 holds the meta event type and meta_data the
+        payload; meta_data is None for all other events. Unused parameters
+        are set to 0.
+        """
+        try:
+            while pos < end:
+                # Delta time as a variable length quantity. Most fit in one
+                # byte, so only call the decoder for the longer ones.
+                delta_time = data[pos]
+                if delta_time & 0x80:
+                    (delta_time, pos) = varbyte.decode(data, pos)
+                else:
+                    pos += 1
+
+                ec = data[pos]
+                pos += 1
+                event_type = ec >> 4
+                if event_type == 0x0f:
+                    meta_event = data[pos]
+                    (length, pos) = varbyte.decode(data, pos + 1)
+                    yield (delta_time, event_type, ec & 0x0f, meta_event, 0,
+                           bytes(data[pos:pos + length]))
+                    pos += length
+                elif event_type in (12, 13):
+                    yield (delta_time, event_type, ec & 0x0f, data[pos], 0,
+                           None)
+                    pos += 1
+                elif event_type >= 8:
+                    yield (delta_time, event_type, ec & 0x0f, data[pos],
+                           data[pos + 1], None)
+                    pos += 2
+                else:
+                    raise FormatError('Unknown event type %d. Byte %d.'
+                            % (event_type, pos))
+        except IndexError:
+            raise IOError('Unexpected end of MIDI data. Byte %d.' % pos)
+
+    def parse_track_data_array(self, data, pos, end):
+        """Parse the events between the offsets pos and end of data into a
+        NumPy structured array.
+
+        Return a tuple containing the array, with the fields in EVENT_DTYPE,
+        and a dictionary that maps the indices of the meta events in the
+        array to their payloads. The meta event type is stored in the p1
+        field.
+
+        This function needs NumPy.
+        """
+        import numpy
+        rows = []
+        meta = {}
+        for (delta_time, event_type, channel, param1, param2,
+             meta_data) in self.iter_raw_track_data(data, pos, end):
+            if meta_data is not None:
+                meta[len(rows)] = meta_data
+            rows.append((delta_time, event_type, channel, param1, param2))
+        events = numpy.zeros(len(rows), dtype=EVENT_DTYPE)
+        if rows:
+            raw = numpy.array(rows, dtype=EVENT_DTYPE[1:])
+            for (name, dtype) in EVENT_DTYPE[1:]:
+                events[name] = raw[name]
+            events['tick'] = numpy.cumsum(raw['delta'], dtype=numpy.int64)
+        return (events, meta)
+
+    def parse_midi_file_arrays(self, file):
+        """Parse a MIDI file into NumPy structured arrays.
+
+        Return the header -like parse_midi_file- and a list containing an
+        (events, meta) tuple for every track, as returned by
+        parse_track_data_array.
+        """
+        data = self.read_midi_data(file)
+        (header, chunks) = self.scan_midi_data(data)
+        return (header, [self.parse_track_data_array(data, start, end)
+                for (start, end) in chunks])
+
+    def scan_midi_file(self, fp):
+        """Read the header and the track chunk headers from fp, seeking past
+        the event data.
+
+        Return the header and a list of (start, end) tuples with the file
+        offsets of the event data of every track.
+        """
+        (header, pos) = self.parse_midi_data_header(bytearray(fp.read(14)))
+        fp.seek(0, 2)
+        file_size = fp.tell()
+        chunks = []
+        for i in xrange(header[1]):
+            fp.seek(pos)
+            (start, end) = self.parse_track_data_header(
+                    bytearray(fp.read(8)), 0)
+            (start, end) = (pos + start, pos + end)
+            if end > file_size:
+                raise IOError('Track chunk at byte %d runs past the end of '
+                        'the file.' % pos)
+            chunks.append((start, end))
+            pos = end
+        self.bytes_read = pos
+        return (header, chunks)
+
+    def parse_midi_file_parallel(self, file, processes=None, arrays=False):
+        """Parse a MIDI file, decoding the tracks in parallel.
+
+        The track chunk headers are scanned first; then every track is
+        handed to a pool of worker processes as a file name and a pair of
+        offsets. The workers read their own chunk from the file, so the raw
+        bytes are never sent between processes.
+
+        Return the same (header, track_data) tuple as parse_midi_file, which
+        can be converted with track_data_to_Composition. If arrays is True
+        the tracks are returned as NumPy arrays instead, like
+        parse_midi_file_arrays.
+
+        Sending the event dictionaries back from the workers costs more
+        than decoding them, so this mostly pays off with arrays set to True
+        and large files with many tracks.
+        """
+        try:
+            f = open(file, 'rb')
+        except:
+            raise IOError('File not found')
+        try:
+            (header, chunks) = self.scan_midi_file(f)
+        finally:
+            f.close()
+        pool = multiprocessing.Pool(processes)
+        try:
+            track_data = pool.map(_parse_track_chunk, [(file, start, end,
+                                  arrays) for (start, end) in chunks], 1)
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+        return (header, track_data)
+
+    def iter_events(self, file, track=None, merge=False):
+        """Generate the events of a MIDI file without collecting them in
+        lists.
+
+        Yield (track_number, tick, event) tuples, where tick is the absolute
+        time of the event in ticks and event is a dictionary like the ones
+        in parse_track.
+
+        The tracks are generated one after the other, unless merge is True,
+        in which case the events of all the tracks are merged in order of
+        their ticks. Set track to a track number to only read that track.
+
+        The tracks are decoded while they are read, a few kilobytes at a
+        time, so the memory used doesn't depend on the size of the file.
+        """
+        try:
+            f = open(file, 'rb')
+        except:
+            raise IOError('File not found')
+        try:
+            (header, chunks) = self.scan_midi_file(f)
+            if track is not None:
+                streams = [self._iter_chunk_events(f, track, *chunks[track])]
+            else:
+                streams = [self._iter_chunk_events(f, n, start, end) for (n,
+                           (start, end)) in enumerate(chunks)]
+            if merge:
+                events = heapq.merge(*streams)
+            else:
+                events = itertools.chain(*streams)
+            for (tick, n, i, event) in events:
+                yield (n, tick, event)
+        finally:
+            f.close()
+
+    def _iter_chunk_events(self, fp, track, start, end):
+        """Decode one track chunk of fp and generate (tick, track, index,
+        event) tuples that can be merged with heapq.
+
+        The chunk is read through a _ChunkReader, so only a small part of
+        it is in memory at a time.
+        """
+        reader = _ChunkReader(fp, start, end)
+        tick = 0
+        i = 0
+        while reader.remaining() > 0:
+            (delta_time, chunk_delta) = self.parse_varbyte_as_int(reader)
+            (event, chunk_delta) = self.parse_midi_event(reader)
+            tick += delta_time
+            yield (tick, track, i, event)
+            i += 1
+
     def parse_varbyte_as_int(self, fp, return_bytes_read=True):
         """Read a variable length byte from the file and return the
         corresponding integer."""
-        result = 0
-        bytes_read = 0
-        r = 0x80
-        while r & 0x80:
-            try:
-                r = self.bytes_to_int(fp.read(1))
-                self.bytes_read += 1
-            except:
-                raise IOError("Couldn't read variable length byte from file.")
-            if r & 0x80:
-                result = (result << 7) + (r & 0x7F)
-            else:
-                result = (result << 7) + r
-            bytes_read += 1
+        (result, bytes_read) = varbyte.read(fp)
+        self.bytes_read += bytes_read
         if not return_bytes_read:
             return result
         else:
             return (result, bytes_read)
 
 
+class _ChunkReader(object):
+
+    """Reads the bytes between the offsets start and end of a file through
+    a small buffer.
+
+    Every reader keeps its own offset and seeks to it before reading, so the
+    tracks of a file can be read side by side from the same file object.
+    """
+
+    buffer_size = 4096
+
+    def __init__(self, fp, start, end):
+        self.fp = fp
+        self.offset = start
+        self.end = end
+        self.buffer = b''
+        self.pos = 0
+
+    def remaining(self):
+        """Return the number of bytes that haven't been read yet."""
+        return len(self.buffer) - self.pos + self.end - self.offset
+
+    def read(self, n=1):
+        if len(self.buffer) - self.pos < n:
+            size = min(max(n, self.buffer_size), self.end - self.offset)
+            self.fp.seek(self.offset)
+            data = self.fp.read(size)
+            self.offset += len(data)
+            self.buffer = self.buffer[self.pos:] + data
+            self.pos = 0
+        data = self.buffer[self.pos:self.pos + n]
+        self.pos += len(data)
+        return data
+
+
+def _parse_track_chunk(args):
+    """Read and parse one track chunk in a parse_midi_file_parallel worker
+    process."""
+    (file, start, end, arrays) = args
+    f = open(file, 'rb')
+    try:
+        f.seek(start)
+        data = bytearray(f.read(end - start))
+    finally:
+        f.close()
+    if arrays:
+        return MidiFile().parse_track_data_array(data, 0, len(data))
+    return MidiFile().parse_track_data(data, 0, len(data))
+
+def _convert_MIDI_file(file):
+    """Convert a single file in a MidiFileBatch worker process.
+
+    Return a tuple (file, composition, bpm, error, number of events).
+    """
+    m = MidiFile()
+    try:
+        (header, track_data) = m.parse_midi_file_buffered(file)
+        events = sum([len(t) for t in track_data])
+        (composition, bpm) = m.track_data_to_Composition(header, track_data)
+    except Exception as e:
+        return (file, None, None, e, 0)
+    return (file, composition, bpm, None, events)
+
+
+class MidiFileBatch(object):
+
+    """Convert a lot of MIDI files to Compositions on a pool of processes.
+
+    Iterate over the batch to get (file, composition, bpm) tuples. At most
+    max_pending files are handed to the pool at the same time, so a huge
+    corpus doesn't get queued up in memory all at once. If ordered is True
+    the results are generated in the order of the files, otherwise as soon
+    as they are done.
+
+    Errors don't stop the run: the (file, exception) tuples are collected
+    in errors. After (or during) a run, files_per_second and
+    events_per_second report the throughput.
+    """
+
+    extensions = ['*.mid', '*.midi']
+
+    def __init__(self, files, processes=None, max_pending=None, ordered=True):
+        """The files argument can be a directory, which is searched
+        recursively for MIDI files, a glob pattern or a list of file
+        names."""
+        if isinstance(files, _string_types):
+            if os.path.isdir(files):
+                files = self.find_files(files)
+            else:
+                files = sorted(glob.glob(files))
+        self.files = files
+        self.processes = processes or multiprocessing.cpu_count()
+        self.max_pending = max_pending or self.processes * 2
+        self.ordered = ordered
+        self.converted = 0
+        self.events = 0
+        self.errors = []
+        self.elapsed = 0.0
+
+    def find_files(self, directory):
+        """Return a sorted list of the MIDI files in directory and its
+        subdirectories."""
+        result = []
+        for (root, dirs, files) in os.walk(directory):
+            for f in files:
+                for ext in self.extensions:
+                    if fnmatch.fnmatch(f.lower(), ext):
+                        result.append(os.path.join(root, f))
+                        break
+        return sorted(result)
+
+    def __iter__(self):
+        self.converted = 0
+        self.events = 0
+        self.errors = []
+        self.elapsed = 0.0
+        start = time.time()
+        pool = multiprocessing.Pool(self.processes)
+        pending = collections.deque()
+        try:
+            for file in self.files:
+                pending.append(pool.apply_async(_convert_MIDI_file, (file, )))
+                while len(pending) >= self.max_pending:
+                    result = self._next_result(pending)
+                    self.elapsed = time.time() - start
+                    if result is not None:
+                        yield result
+            while pending:
+                result = self._next_result(pending)
+                self.elapsed = time.time() - start
+                if result is not None:
+                    yield result
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+            self.elapsed = time.time() - start
+
+    def _next_result(self, pending):
+        """Wait for the next converted file and update the statistics.
+
+        Return a (file, composition, bpm) tuple, or None if the file could
+        not be converted. Exceptions raised outside the conversion, like
+        results that can't be pickled, are raised here.
+        """
+        if self.ordered:
+            result = pending.popleft()
+        else:
+            # Take the first file that is done, polling the oldest one
+            # for a while if none is
+            while True:
+                ready = [r for r in pending if r.ready()]
+                if ready:
+                    result = ready[0]
+                    break
+                pending[0].wait(0.01)
+            pending.remove(result)
+        (file, composition, bpm, error, events) = result.get()
+        if error is not None:
+            self.errors.append((file, error))
+            return None
+        self.converted += 1
+        self.events += events
+        return (file, composition, bpm)
+
+    def files_per_second(self):
+        """Return the number of files processed per second, including the
+        ones that failed."""
+        if self.elapsed <= 0:
+            return 0.0
+        return (self.converted + len(self.errors)) / self.elapsed
+
+    def events_per_second(self):
+        """Return the number of MIDI events converted per second."""
+        if self.elapsed <= 0:
+            return 0.0
+        return self.events / self.elapsed
+
+
 if __name__ == '__main__':
     from sys import argv
     import fluidsynth
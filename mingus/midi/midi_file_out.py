@@ -21,7 +21,7 @@
 mingus.containers."""
 
 from midi_track import MidiTrack
-from binascii import a2b_hex
+from struct import pack
 
 class MidiFile(object):
 
@@ -36,35 +36,84 @@ class MidiFile(object):
 
     def get_midi_data(self):
         """Collect and return the raw, binary MIDI data from the tracks."""
-        tracks = [t.get_midi_data() for t in self.tracks if t.track_data != '']
+        tracks = [t.get_midi_data() for t in self.tracks if t.track_data]
         return self.header() + ''.join(tracks)
 
-    def header(self):
-        """Return a header for type 1 MIDI file."""
-        tracks = a2b_hex('%04x' % len([t for t in self.tracks if
-            t.track_data != '']))
+    def header(self, number_of_tracks=None):
+        """Return a header for type 1 MIDI file.
+
+        The number of tracks defaults to the number of tracks that contain
+        data.
+        """
+        if number_of_tracks is None:
+            number_of_tracks = len([t for t in self.tracks if t.track_data])
+        tracks = pack('>H', number_of_tracks)
         return 'MThd\x00\x00\x00\x06\x00\x01' + tracks + self.time_division
 
     def reset(self):
         """Reset every track."""
         [t.reset() for t in self.tracks]
 
-    def write_file(self, file, verbose=False):
-        """Collect the data from get_midi_data and write to file."""
-        dat = self.get_midi_data()
+    def write_to(self, fp, tracks=None, number_of_tracks=None):
+        """Write the MIDI data to the file-like object fp, one chunk at a
+        time, and return the number of bytes written.
+
+        The data of the whole file is never collected in one string. tracks
+        can be any iterable of MidiTracks -for instance a generator that
+        only renders a track when it is needed- and defaults to the tracks
+        of this MidiFile that contain data. Every track is written as soon
+        as it is generated.
+
+        If number_of_tracks isn't given for a custom iterable, the track
+        count in the header is patched after the last track has been
+        written, which only works if fp is seekable.
+        """
+        if tracks is None:
+            tracks = [t for t in self.tracks if t.track_data]
+            number_of_tracks = len(tracks)
+        if number_of_tracks is None:
+            start = fp.tell()
+        header = self.header(number_of_tracks or 0)
+        fp.write(header)
+        written = len(header)
+        count = 0
+        for t in tracks:
+            for data in (t.header(), bytes(t.track_data), t.end_of_track()):
+                fp.write(data)
+                written += len(data)
+            count += 1
+        if number_of_tracks is None:
+            end = fp.tell()
+            fp.seek(start + 10)
+            fp.write(pack('>H', count))
+            fp.seek(end)
+        return written
+
+    def write_file(self, file, verbose=False, tracks=None,
+                   number_of_tracks=None):
+        """Write the MIDI data to file.
+
+        The file can be a file name or a file-like object, like an open
+        file or a StringIO object. See write_to for the tracks and
+        number_of_tracks arguments.
+        """
+        if hasattr(file, 'write'):
+            f = file
+        else:
+            try:
+                f = open(file, 'wb')
+            except:
+                print "Couldn't open '%s' for writing." % file
+                return False
         try:
-            f = open(file, 'wb')
-        except:
-            print "Couldn't open '%s' for writing." % file
-            return False
-        try:
-            f.write(dat)
+            written = self.write_to(f, tracks, number_of_tracks)
         except:
             print 'An error occured while writing data to %s.' % file
             return False
-        f.close()
+        if f is not file:
+            f.close()
         if verbose:
-            print 'Written %d bytes to %s.' % (len(dat), file)
+            print 'Written %d bytes to %s.' % (written, file)
         return True
 
 
@@ -128,17 +177,38 @@ def write_Track(file, track, bpm=120, repeat=0, verbose=False):
     return m.write_file(file, verbose)
 
 def write_Composition(file, composition, bpm=120, repeat=0, verbose=False):
-    """Write a mingus.Composition to a MIDI file."""
+    """Write a mingus.Composition to a MIDI file.
+
+    The tracks are rendered and written one at a time, so only one track
+    is kept in memory. file can also be a file-like object.
+
+    If the composition has a tempo_map attribute, like the ones read by
+    midi_file_in, the tempo changes in it are written to a separate first
+    track and bpm is ignored. The tempo map is only written once, also when
+    the composition is repeated.
+    """
     m = MidiFile()
-    t = []
-    for x in range(len(composition.tracks)):
-        t += [MidiTrack(bpm)]
-    m.tracks = t
-    while repeat >= 0:
-        for i in range(len(composition.tracks)):
-            m.tracks[i].play_Track(composition.tracks[i])
-        repeat -= 1
-    return m.write_file(file, verbose)
+    tempo_map = getattr(composition, 'tempo_map', None)
+    number_of_tracks = len(composition.tracks)
+    if tempo_map is not None:
+        number_of_tracks += 1
+    return m.write_file(file, verbose, _composition_tracks(composition, bpm,
+                        repeat, tempo_map), number_of_tracks)
+
+def _composition_tracks(composition, bpm, repeat, tempo_map):
+    """Generate the MidiTracks for write_Composition one at a time."""
+    if tempo_map is not None:
+        t = MidiTrack()
+        t.reset()
+        t.play_TempoMap(tempo_map)
+        yield t
+    for track in composition.tracks:
+        t = MidiTrack(bpm)
+        if tempo_map is not None:
+            t.reset()
+        for i in range(repeat + 1):
+            t.play_Track(track)
+        yield t
 
 if __name__ == '__main__':
     from mingus.containers.NoteContainer import NoteContainer
@@ -24,19 +24,22 @@ The MIDI file format specification I used can be found here:
 http://www.sonicspot.com/guide/midifiles.html
 """
 
-from binascii import a2b_hex
 from struct import pack, unpack
 from math import log
 from midi_events import *
+import varbyte
 from mingus.core.keys import Key, major_keys, minor_keys
 from mingus.containers.note import Note
 
 class MidiTrack(object):
 
     """A class used to generate MIDI events from the objects in
-    mingus.containers."""
+    mingus.containers.
+
+    The events are appended to track_data, a bytearray, so that building a
+    track takes time linear in the number of events.
+    """
 
-    track_data = ''
     delta_time = '\x00'
     delay = 0
     bpm = 120
@@ -44,7 +47,7 @@ class MidiTrack(object):
     instrument = 1
 
     def __init__(self, start_bpm=120):
-        self.track_data = ''
+        self.track_data = bytearray()
         self.set_tempo(start_bpm)
 
     def end_of_track(self):
@@ -72,7 +75,7 @@ class MidiTrack(object):
         if self.change_instrument:
             self.set_instrument(channel, self.instrument)
             self.change_instrument = False
-        self.track_data += self.note_on(channel, int(note) + 12, velocity)
+        self.write_midi_event(NOTE_ON, channel, int(note) + 12, velocity)
 
     def play_NoteContainer(self, notecontainer):
         """Convert a mingus.containers.NoteContainer to the equivalent MIDI
@@ -135,7 +138,7 @@ class MidiTrack(object):
             channel = note.channel
         if hasattr(note, 'velocity'):
             velocity = note.velocity
-        self.track_data += self.note_off(channel, int(note) + 12, velocity)
+        self.write_midi_event(NOTE_OFF, channel, int(note) + 12, velocity)
 
     def stop_NoteContainer(self, notecontainer):
         """Add note_off events for each note in the NoteContainer to the
@@ -152,7 +155,7 @@ class MidiTrack(object):
     def set_instrument(self, channel, instr, bank=1):
         """Add a program change and bank select event to the track_data."""
         self.track_data += self.select_bank(channel, bank)
-        self.track_data += self.program_change_event(channel, instr)
+        self.write_midi_event(PROGRAM_CHANGE, channel, instr)
 
     def header(self):
         """Return the bytes for the header of track.
@@ -161,8 +164,8 @@ class MidiTrack(object):
         call this function when you're done adding data (when you're not
         using get_midi_data).
         """
-        chunk_size = a2b_hex('%08x' % (len(self.track_data)
-                              + len(self.end_of_track())))
+        chunk_size = pack('>L', len(self.track_data)
+                          + len(self.end_of_track()))
         return TRACK_HEADER + chunk_size
 
     def get_midi_data(self):
@@ -170,18 +173,32 @@ class MidiTrack(object):
 
         Include header, track_data and the end of track meta event.
         """
-        return self.header() + self.track_data + self.end_of_track()
+        return self.header() + bytes(self.track_data) + self.end_of_track()
 
     def midi_event(self, event_type, channel, param1, param2=None):
         """Convert and return the paraters as a MIDI event in bytes."""
         assert event_type < 0x80 and event_type >= 0
         assert channel < 16 and channel >= 0
-        tc = a2b_hex('%x%x' % (event_type, channel))
         if param2 is None:
-            params = a2b_hex('%02x' % param1)
-        else:
-            params = a2b_hex('%02x%02x' % (param1, param2))
-        return self.delta_time + tc + params
+            return self.delta_time + pack('BB', event_type << 4 | channel,
+                    param1)
+        return self.delta_time + pack('BBB', event_type << 4 | channel,
+                param1, param2)
+
+    def write_midi_event(self, event_type, channel, param1, param2=None):
+        """Append a MIDI event to the track_data.
+
+        This does the same as adding the result of midi_event to track_data,
+        without building intermediate strings.
+        """
+        assert event_type < 0x80 and event_type >= 0
+        assert channel < 16 and channel >= 0
+        data = self.track_data
+        data += self.delta_time
+        data.append(event_type << 4 | channel)
+        data.append(param1)
+        if param2 is not None:
+            data.append(param2)
 
     def note_off(self, channel, note, velocity):
         """Return bytes for a 'note off' event."""
@@ -197,7 +214,7 @@ class MidiTrack(object):
 
     def reset(self):
         """Reset track_data and delta_time."""
-        self.track_data = ''
+        self.track_data = bytearray()
         self.delta_time = '\x00'
 
     def set_deltatime(self, delta_time):
@@ -225,17 +242,36 @@ class MidiTrack(object):
     def set_tempo_event(self, bpm):
         """Calculate the microseconds per quarter note."""
         ms_per_min = 60000000
-        mpqn = a2b_hex('%06x' % (ms_per_min / bpm))
+        return self.tempo_event(ms_per_min / bpm)
+
+    def tempo_event(self, mpqn):
+        """Return the bytes for a set tempo event of mpqn microseconds per
+        quarter note."""
+        mpqn = pack('>L', mpqn)[1:]
         return self.delta_time + META_EVENT + SET_TEMPO + '\x03' + mpqn
 
+    def play_TempoMap(self, tempo_map):
+        """Write the tempo changes in a TempoMap to the track_data.
+
+        The ticks of the TempoMap are converted to the 72 ticks per quarter
+        note used in this track.
+        """
+        last = 0
+        for (tick, mpqn) in tempo_map:
+            tick = int(round(tick * 72.0 / tempo_map.ticks_per_beat))
+            self.set_deltatime(tick - last)
+            self.track_data += self.tempo_event(mpqn)
+            last = tick
+        self.set_deltatime(0)
+
     def set_meter(self, meter=(4, 4)):
         """Add a time signature event for meter to track_data."""
         self.track_data += self.time_signature_event(meter)
 
     def time_signature_event(self, meter=(4, 4)):
         """Return a time signature event for meter."""
-        numer = a2b_hex('%02x' % meter[0])
-        denom = a2b_hex('%02x' % int(log(meter[1], 2)))
+        numer = pack('B', meter[0])
+        denom = pack('B', int(log(meter[1], 2)))
         return self.delta_time + META_EVENT + TIME_SIGNATURE + '\x04' + numer\
              + denom + '\x18\x08'
 
@@ -253,9 +289,7 @@ class MidiTrack(object):
         else:
             val = major_keys.index(key) - 7
             mode = '\x00'
-        if val < 0:
-            val = 256 + val
-        key = a2b_hex('%02x' % val)
+        key = pack('b', val)
         return '{0}{1}{2}\x02{3}{4}'.format(self.delta_time, META_EVENT,
                 KEY_SIGNATURE, key, mode)
 
@@ -271,20 +305,6 @@ class MidiTrack(object):
     def int_to_varbyte(self, value):
         """Convert an integer into a variable length byte.
 
-        How it works: the bytes are stored in big-endian (significant bit
-        first), the highest bit of the byte (mask 0x80) is set when there
-        are more bytes following. The remaining 7 bits (mask 0x7F) are used
-        to store the value.
+        See mingus.midi.varbyte for how these are encoded.
         """
-        # Warning: bit kung-fu ahead. The length of the integer in bytes
-        length = int(log(max(value, 1), 0x80)) + 1
-
-        # Remove the highest bit and move the bits to the right if length > 1
-        bytes = [value >> i * 7 & 0x7F for i in range(length)]
-        bytes.reverse()
-
-        # Set the first bit on every one but the last bit.
-        for i in range(len(bytes) - 1):
-            bytes[i] = bytes[i] | 0x80
-        return pack('%sB' % len(bytes), *bytes)
-
+        return varbyte.encode(value)
@@ -0,0 +1,162 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+#    mingus - Music theory Python package, playback_plan module.
+#    Copyright (C) 2008-2009, Bart Spaans
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Compile Tracks and Compositions into flat lists of timed MIDI events.
+
+A PlaybackPlan holds all the events needed to play a piece as (seconds,
+kind, channel, param1, param2) tuples, sorted by time. All the work of
+walking the bars, looking up the tempo and pairing the note on and off
+events is done once, when the plan is made; a Sequencer can then play the
+same plan as many times as needed (see Sequencer.play_Plan).
+"""
+
+from mingus.containers.instrument import MidiInstrument
+from mingus.midi.tempo_map import TempoMap
+import bisect
+
+# Kinds of events, in the order in which events at the same time are sent
+EVENT_INSTR = 0
+EVENT_STOP = 1
+EVENT_PLAY = 2
+
+def instrument_number(instr):
+    """Return the MIDI program number of a Track's instrument."""
+    if isinstance(instr, MidiInstrument):
+        try:
+            return instr.names.index(instr.name)
+        except:
+            return 1
+    return 1
+
+class PlaybackPlan(object):
+
+    """A sorted, read only list of timed MIDI events.
+
+    The events are (seconds, kind, channel, param1, param2) tuples, where
+    seconds is the time since the start of the plan and kind is one of
+    EVENT_INSTR (param1 and param2 are the instrument and bank), EVENT_STOP
+    (the note) and EVENT_PLAY (the note and velocity).
+
+    The length attribute holds the time in seconds at which the longest
+    track ends, which is where the plan starts over when it is looped.
+    """
+
+    def __init__(self, tracks, channels, bpm=120, tempo_map=None):
+        """Compile a list of Tracks that are played on the given channels.
+
+        The start of every bar is calculated from the start of the piece
+        instead of by adding up the lengths of the notes before it. The
+        tempo is taken from tempo_map if one is given; otherwise bpm
+        attributes on the NoteContainers change the tempo, like they do in
+        Sequencer.play_Bars.
+        """
+        changes = []
+        notes = []
+        end_beat = 0.0
+        for (track, channel) in zip(tracks, channels):
+            beat = 0.0
+            for bar in track:
+                for (start, duration, nc) in bar:
+                    if nc is None:
+                        continue
+                    begin = beat + start * 4
+                    if hasattr(nc, 'bpm'):
+                        changes.append((begin, nc.bpm))
+                    end = begin + 4.0 / duration
+                    for note in nc:
+                        notes.append((begin, end, note, channel))
+                beat += bar.length * 4
+            end_beat = max(end_beat, beat)
+        if tempo_map is None:
+            tempo_map = TempoMap(1, bpm)
+            for (beat, b) in sorted(changes, key=lambda x: x[0]):
+                tempo_map.set_bpm(beat, b)
+        seconds = tempo_map.beats_to_seconds
+        events = []
+        for (track, channel) in zip(tracks, channels):
+            events.append((0.0, EVENT_INSTR, channel,
+                          instrument_number(track.instrument), 0))
+        for (begin, end, note, channel) in notes:
+            channel = int(getattr(note, 'channel', channel))
+            velocity = int(getattr(note, 'velocity', 100))
+            events.append((seconds(begin), EVENT_PLAY, channel, int(note)
+                          + 12, velocity))
+            events.append((seconds(end), EVENT_STOP, channel, int(note) + 12,
+                          0))
+        events.sort()
+        self._events = tuple(events)
+        self._times = tuple([e[0] for e in events])
+        self.channels = tuple(channels)
+        self.tempo_map = tempo_map
+        self.length = max(seconds(end_beat), self.duration)
+
+    @classmethod
+    def from_Composition(cls, composition, channels=None, bpm=120):
+        """Compile a Composition.
+
+        The channels default to 1, 2, 3, ... for the tracks. The tempo_map
+        attribute of the composition is used if it has one.
+        """
+        if channels == None:
+            channels = list(map(lambda x: x + 1,
+                            range(len(composition.tracks))))
+        return cls(composition.tracks, channels, bpm, getattr(composition,
+                   'tempo_map', None))
+
+    @classmethod
+    def from_Track(cls, track, channel=1, bpm=120):
+        """Compile a single Track."""
+        return cls([track], [channel], bpm)
+
+    @property
+    def duration(self):
+        """The time of the last event in seconds. See the length attribute
+        for the length of the music, including the rests at the end."""
+        if not self._times:
+            return 0.0
+        return self._times[-1]
+
+    def index(self, seconds):
+        """Return the index of the first event at or after seconds."""
+        return bisect.bisect_left(self._times, seconds)
+
+    def events_from(self, seconds):
+        """Return the events at or after seconds as a tuple."""
+        return self._events[self.index(seconds):]
+
+    def __iter__(self):
+        return iter(self._events)
+
+    def __len__(self):
+        return len(self._events)
+
+    def __getitem__(self, index):
+        return self._events[index]
+
+    def __eq__(self, other):
+        if not isinstance(other, PlaybackPlan):
+            return False
+        return self._events == other._events
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __repr__(self):
+        return '<PlaybackPlan %d events, %.3f seconds>' % (len(self),
+                self.duration)
@@ -165,6 +165,16 @@ fluid_synth_write_s16 = cfunc('fluid_synth_write_s16', c_void_p,
                               ('roff', c_int, 1),
                               ('rincr', c_int, 1))
 
+fluid_synth_write_float = cfunc('fluid_synth_write_float', c_void_p,
+                                ('synth', c_void_p, 1),
+                                ('len', c_int, 1),
+                                ('lbuf', c_void_p, 1),
+                                ('loff', c_int, 1),
+                                ('lincr', c_int, 1),
+                                ('rbuf', c_void_p, 1),
+                                ('roff', c_int, 1),
+                                ('rincr', c_int, 1))
+
 class fluid_synth_channel_info_t(Structure):
     _fields_ = [
         ('assigned', c_int),
@@ -267,6 +277,12 @@ fluid_sequencer_send_at = cfunc('fluid_sequencer_send_at', c_int,
                                ('absolute', c_int, 1))
                                
 
+fluid_sequencer_remove_events = cfunc('fluid_sequencer_remove_events', None,
+                                     ('seq', c_void_p, 1),
+                                     ('source', c_short, 1),
+                                     ('dest', c_short, 1),
+                                     ('type', c_int, 1))
+
 delete_fluid_sequencer = cfunc('delete_fluid_sequencer', None,
                               ('seq', c_void_p, 1))
 
@@ -382,16 +398,44 @@ fluid_midi_router_add_rule = cfunc('fluid_midi_router_add_rule', c_int,
                                     ('rule', c_void_p, 1),
                                     ('type', c_int, 1))
         
-def fluid_synth_write_s16_stereo(synth, len):
+def _stereo_buffer(len, out, dtype):
+    """Return the first 2 * len samples of out, or a new array if out is
+    None, after checking that FluidSynth can write into it directly."""
+    import numpy
+    if out is None:
+        return numpy.empty(len * 2, dtype=dtype)
+    if out.dtype != dtype or out.ndim != 1 or not out.flags.c_contiguous\
+         or not out.flags.writeable:
+        raise ValueError('out must be a writeable, contiguous, one '
+                         'dimensional array of %s' % numpy.dtype(dtype).name)
+    if out.shape[0] < len * 2:
+        raise ValueError('out is too small for %d stereo frames' % len)
+    return out[:len * 2]
+
+def fluid_synth_write_s16_stereo(synth, len, out=None):
     """Return generated samples in stereo 16-bit format
     
-    Return value is a Numpy array of samples.
+    Return value is a Numpy array of samples. If out is given, it should be
+    a one dimensional int16 array of at least 2 * len samples, and the
+    samples are written straight into it without copying; the part of out
+    that was written is returned.
     
     """
-    import numpy
-    buf = create_string_buffer(len * 4)
-    fluid_synth_write_s16(synth, len, buf, 0, 2, buf, 1, 2)
-    return numpy.frombuffer(buf[:], dtype=numpy.int16)
+    buf = _stereo_buffer(len, out, 'int16')
+    fluid_synth_write_s16(synth, len, buf.ctypes.data, 0, 2, buf.ctypes.data,
+                          1, 2)
+    return buf
+
+def fluid_synth_write_float_stereo(synth, len, out=None):
+    """Return generated samples in stereo 32-bit float format
+
+    Like fluid_synth_write_s16_stereo, but out should be a float32 array.
+    The samples are between -1.0 and 1.0.
+    """
+    buf = _stereo_buffer(len, out, 'float32')
+    fluid_synth_write_float(synth, len, buf.ctypes.data, 0, 2,
+                            buf.ctypes.data, 1, 2)
+    return buf
 
 
 # Object-oriented interface, simplifies access to functions
@@ -632,15 +676,27 @@ class Synth:
     def system_reset(self):
         """Stop all notes and reset all programs"""
         return fluid_synth_system_reset(self.synth)
-    def get_samples(self, len=1024):
+    def get_samples(self, len=1024, out=None):
         """Generate audio samples
 
         The return value will be a NumPy array containing the given
         length of audio samples.  If the synth is set to stereo output
         (the default) the array will be size 2 * len.
 
+        To avoid allocating memory for every block, a reusable int16 array
+        of at least 2 * len samples can be given as out; the samples are
+        written into it and the part that was filled is returned.
+
+        """
+        return fluid_synth_write_s16_stereo(self.synth, len, out)
+    def get_samples_float(self, len=1024, out=None):
+        """Generate audio samples as 32-bit floats
+
+        Like get_samples, but the samples are float32 values between -1.0
+        and 1.0 and out, if given, should be a float32 array.
+
         """
-        return fluid_synth_write_s16_stereo(self.synth, len)
+        return fluid_synth_write_float_stereo(self.synth, len, out)
 
 class Sequencer:
     def __init__(self, time_scale=1000, use_system_timer=True):
@@ -706,6 +762,11 @@ class Sequencer:
         if response == FLUID_FAILED:
             raise Error("Scheduling event failed")
 
+    def remove_events(self, source=-1, dest=-1, type=-1):
+        """Remove the scheduled events from source to dest of the given
+        type; -1 matches everything."""
+        fluid_sequencer_remove_events(self.sequencer, source, dest, type)
+
     def get_tick(self):
         return fluid_sequencer_get_tick(self.sequencer)
 
@@ -23,12 +23,43 @@ You can use the Sequencer object either by creating a subclass and
 implementing some of the events (init, play_event, stop_event, cc_event,
 instr_event) or by attaching observer objects via 'attach' and catching the
 messages in the notify(msg_type, param_dict) function of your object.
+Observers can subscribe to only some of the message types; the parameters
+of a message are only built when somebody listens to it.
 
 See SequencerObserver for a pre made, easy to extend base class that can be
 attached to the Sequencer.
+
+Compositions are played by first compiling them into a PlaybackPlan, a list
+of events with absolute times (see compile_Composition and play_Plan), so
+that the time spent between the events never adds up. Plans can also be
+played in the background with start, and controlled while they play.
 """
 
-from mingus.containers.instrument import MidiInstrument
+from mingus.midi.playback_plan import PlaybackPlan, instrument_number, \
+     EVENT_INSTR, EVENT_STOP, EVENT_PLAY
+from mingus.midi.transport import Transport
+import math
+import threading
+import time
+
+try:
+    _clock = time.monotonic
+except AttributeError:
+    _clock = time.time
+
+def timing_report(n, total, total_abs, total_sq, largest, drift, duration):
+    """Return the timing report of play_events from the number of events
+    and the sum, the sum of the absolute values, the sum of the squares and
+    the largest absolute value of their timing errors."""
+    mean = total / max(n, 1)
+    return {
+        'events': n,
+        'duration': duration,
+        'mean': total_abs / max(n, 1),
+        'max': largest,
+        'jitter': math.sqrt(max(total_sq / max(n, 1) - mean * mean, 0.0)),
+        'drift': drift,
+        }
 
 class Sequencer(object):
 
@@ -38,6 +69,8 @@ class Sequencer(object):
     implementing some of the events (init, play_event, stop_event, cc_event,
     instr_event) or by attaching observer objects via 'attach' and catching 
     the messages in the notify(msg_type, param_dict) function of your object.
+    Sequencers that don't play in real time should also implement sleep
+    and clock.
 
     See SequencerObserver for a pre made, easy to extend base class that can
     be attached to the Sequencer.
@@ -45,6 +78,10 @@ class Sequencer(object):
 
     output = None
 
+    # False for sequencers whose clock only moves in sleep (see clock); a
+    # Transport then sleeps until the next event instead of waiting
+    realtime = True
+
     # Low level messages
     MSG_PLAY_INT = 0
     MSG_STOP_INT = 1
@@ -62,9 +99,33 @@ class Sequencer(object):
     MSG_PLAY_TRACK = 11
     MSG_PLAY_TRACKS = 12
     MSG_PLAY_COMPOSITION = 13
+    MSG_STOP_ALL = 14
+
+    MSG_TYPES = (MSG_PLAY_INT, MSG_STOP_INT, MSG_CC, MSG_INSTR, MSG_SLEEP,
+                 MSG_PLAY_NOTE, MSG_STOP_NOTE, MSG_PLAY_NC, MSG_STOP_NC,
+                 MSG_PLAY_BAR, MSG_PLAY_BARS, MSG_PLAY_TRACK, MSG_PLAY_TRACKS,
+                 MSG_PLAY_COMPOSITION, MSG_STOP_ALL)
+
+    # Kinds of events in a PlaybackPlan
+    EVENT_INSTR = EVENT_INSTR
+    EVENT_STOP = EVENT_STOP
+    EVENT_PLAY = EVENT_PLAY
 
     def __init__(self):
         self.listeners = []
+        # (listener, message types) pairs of the listeners attached with
+        # msg_types
+        self._listener_types = []
+        # Maps the message types to the listeners that want them; rebuilt
+        # when listeners differs from the copy in _subscribed
+        self._subscriptions = {}
+        self._subscribed = []
+        # Maps the (channel, note) pairs of the notes that are playing to
+        # the number of times they have been started
+        self.sounding = {}
+        # Guards sounding, which a Transport changes from its worker thread
+        self._sounding_lock = threading.Lock()
+        self.transport = None
         self.init()
 
         # Events Implement some of these functions when subclassing
@@ -85,32 +146,118 @@ class Sequencer(object):
         pass
 
     def sleep(self, seconds):
-        pass
+        """Wait seconds seconds between two events; by default with
+        time.sleep."""
+        time.sleep(seconds)
+
+    def clock(self):
+        """Return the current time in seconds, used by play_events.
 
-    def attach(self, listener):
+        Sequencers that don't play in real time, like ones that render to a
+        file in sleep, should return the time they have rendered so far.
+
+        By default this is time.monotonic, or time.time on Python 2, which
+        is not monotonic: changing the system time while playing disturbs
+        the timing.
+        """
+        return _clock()
+
+    def attach(self, listener, msg_types=None):
         """Attach an object that should be notified of events.
 
         The object should have a notify(msg_type, param_dict) function.
+
+        Only the messages with a type in msg_types (a list of MSG_*
+        constants) are sent to the object. If msg_types is None, the
+        msg_types attribute of the object is used, and if it doesn't have
+        one, all messages are sent. Attaching an object again changes the
+        types it is subscribed to.
         """
+        if msg_types is None:
+            msg_types = getattr(listener, 'msg_types', None)
+        if msg_types is None:
+            msg_types = self.MSG_TYPES
+        self._get_subscriptions()
+        self._listener_types = [(l, t) for (l, t) in self._listener_types
+                                if l is not listener]
+        self._listener_types.append((listener, frozenset(msg_types)))
         if listener not in self.listeners:
             self.listeners.append(listener)
+        self._subscribed = None
 
     def detach(self, listener):
         """Detach a listening object so that it won't receive any events
         anymore."""
-        if listener in self.listeners:
+        if listener in self._get_listeners():
             self.listeners.remove(listener)
 
+    def _get_listeners(self):
+        if getattr(self, 'listeners', None) is None:
+            self.listeners = []
+        return self.listeners
+
+    def _get_subscriptions(self):
+        """Return a dictionary that maps the message types to the listeners
+        that are subscribed to them.
+
+        The dictionary is rebuilt when the listeners list has changed, also
+        when listeners were added to or removed from it directly. Those get
+        the messages in their msg_types attribute, or all messages.
+        """
+        try:
+            if self._subscribed == self.listeners:
+                return self._subscriptions
+        except AttributeError:
+            pass
+        return self._update_subscriptions()
+
+    def _update_subscriptions(self):
+        """Rebuild the dictionary returned by _get_subscriptions."""
+        listeners = self._get_listeners()
+        types = [(l, t) for (l, t) in getattr(self, '_listener_types', [])
+                 if l in listeners]
+        subscriptions = {}
+        for listener in listeners:
+            msg_types = None
+            for (l, t) in types:
+                if l is listener:
+                    msg_types = t
+                    break
+            if msg_types is None:
+                msg_types = getattr(listener, 'msg_types', None)
+                if msg_types is None:
+                    msg_types = self.MSG_TYPES
+            for t in msg_types:
+                subscriptions.setdefault(t, []).append(listener)
+        self._listener_types = types
+        self._subscriptions = subscriptions
+        self._subscribed = list(listeners)
+        return subscriptions
+
+    def listening(self, msg_type):
+        """Return True if a listener is subscribed to msg_type."""
+        return msg_type in self._get_subscriptions()
+
     def notify_listeners(self, msg_type, params):
-        """Send a message to all the observers."""
-        for c in self.listeners:
+        """Send a message to the observers that are subscribed to it.
+
+        The params can also be a function without arguments that returns
+        the parameter dictionary; it is only called if somebody listens.
+        """
+        listeners = self._get_subscriptions().get(msg_type)
+        if listeners is None:
+            return
+        if callable(params):
+            params = params()
+        for c in listeners:
             c.notify(msg_type, params)
 
     def set_instrument(self, channel, instr, bank=0):
         """Set the channel to the instrument _instr_."""
         self.instr_event(channel, instr, bank)
-        self.notify_listeners(self.MSG_INSTR, {'channel': int(channel),
-            'instr': int(instr), 'bank': int(bank)})
+        if self.MSG_INSTR in self._get_subscriptions():
+            self.notify_listeners(self.MSG_INSTR, {'channel': int(channel),
+                'instr': int(instr), 'bank': int(bank)})
 
     def control_change(self, channel, control, value):
         """Send a control change message.
@@ -122,8 +269,9 @@ class Sequencer(object):
         if value < 0 or value > 128:
             return False
         self.cc_event(channel, control, value)
-        self.notify_listeners(self.MSG_CC, {'channel': int(channel),
-            'control': int(control), 'value': int(value)})
+        if self.MSG_CC in self._get_subscriptions():
+            self.notify_listeners(self.MSG_CC, {'channel': int(channel),
+                'control': int(control), 'value': int(value)})
         return True
 
     def play_Note(self, note, channel=1, velocity=100):
@@ -133,15 +281,18 @@ class Sequencer(object):
         you can set the Note.velocity and Note.channel attributes, which
         will take presedence over the function arguments.
         """
-        if hasattr(note, 'velocity'):
-            velocity = note.velocity
-        if hasattr(note, 'channel'):
-            channel = note.channel
-        self.play_event(int(note) + 12, int(channel), int(velocity))
-        self.notify_listeners(self.MSG_PLAY_INT, {'channel': int(channel),
-            'note': int(note) + 12, 'velocity': int(velocity)})
-        self.notify_listeners(self.MSG_PLAY_NOTE, {'channel': int(channel),
-            'note': note, 'velocity': int(velocity)})
+        velocity = int(getattr(note, 'velocity', velocity))
+        channel = int(getattr(note, 'channel', channel))
+        pitch = int(note) + 12
+        self.play_event(pitch, channel, velocity)
+        self._note_started(channel, pitch)
+        if self._get_subscriptions():
+            self.notify_listeners(self.MSG_PLAY_INT, lambda : {'channel'
+                                  : channel, 'note': pitch, 'velocity'
+                                  : velocity})
+            self.notify_listeners(self.MSG_PLAY_NOTE, lambda : {'channel'
+                                  : channel, 'note': note, 'velocity'
+                                  : velocity})
         return True
 
     def stop_Note(self, note, channel=1):
@@ -150,25 +301,73 @@ class Sequencer(object):
         If Note.channel is set, it will take presedence over the channel
         argument given here.
         """
-        if hasattr(note, 'channel'):
-            channel = note.channel
-        self.stop_event(int(note) + 12, int(channel))
-        self.notify_listeners(self.MSG_STOP_INT, {'channel': int(channel),
-            'note': int(note) + 12})
-        self.notify_listeners(self.MSG_STOP_NOTE, {'channel': int(channel),
-            'note': note})
+        channel = int(getattr(note, 'channel', channel))
+        pitch = int(note) + 12
+        self.stop_event(pitch, channel)
+        self._note_stopped(channel, pitch)
+        if self._get_subscriptions():
+            self.notify_listeners(self.MSG_STOP_INT, lambda : {'channel'
+                                  : channel, 'note': pitch})
+            self.notify_listeners(self.MSG_STOP_NOTE, lambda : {'channel'
+                                  : channel, 'note': note})
         return True
 
-    def stop_everything(self):
-        """Stop all the notes on all channels."""
-        for x in range(118):
+    def stop_everything(self, all_notes_off=False):
+        """Stop all the notes on all channels.
+
+        Only the notes that are playing (see the sounding attribute) are
+        stopped, once each, also when they were started more than once. If
+        all_notes_off is True, an All Notes Off control change (123) is sent
+        to all 16 channels instead, which also stops notes that were started
+        without this Sequencer knowing about it.
+
+        The listeners get a single MSG_STOP_ALL message with the list of
+        stopped (channel, note) pairs.
+        """
+        sounding = self._get_sounding()
+        with self._sounding_lock:
+            notes = sorted(sounding)
+            sounding.clear()
+        if all_notes_off:
             for c in range(16):
-                self.stop_Note(x, c)
+                self.cc_event(c, 123, 0)
+        else:
+            for (channel, note) in notes:
+                self.stop_event(note, channel)
+        self.notify_listeners(self.MSG_STOP_ALL, lambda : {'notes': notes})
+
+    def _get_sounding(self):
+        try:
+            return self.sounding
+        except AttributeError:
+            self._sounding_lock = threading.Lock()
+            self.sounding = {}
+            return self.sounding
+
+    def _note_started(self, channel, note):
+        """Count a note in the sounding dictionary."""
+        sounding = self._get_sounding()
+        key = (channel, note)
+        with self._sounding_lock:
+            sounding[key] = sounding.get(key, 0) + 1
+
+    def _note_stopped(self, channel, note):
+        """Remove a note from the sounding dictionary once it has been
+        stopped as many times as it was started."""
+        sounding = self._get_sounding()
+        key = (channel, note)
+        with self._sounding_lock:
+            count = sounding.get(key)
+            if count == 1:
+                del sounding[key]
+            elif count:
+                sounding[key] = count - 1
 
     def play_NoteContainer(self, nc, channel=1, velocity=100):
         """Play the Notes in the NoteContainer nc."""
-        self.notify_listeners(self.MSG_PLAY_NC, {'notes': nc,
-            'channel': channel, 'velocity': velocity})
+        if self.MSG_PLAY_NC in self._get_subscriptions():
+            self.notify_listeners(self.MSG_PLAY_NC, {'notes': nc,
+                'channel': channel, 'velocity': velocity})
         if nc is None:
             return True
         for note in nc:
@@ -178,8 +377,9 @@ class Sequencer(object):
 
     def stop_NoteContainer(self, nc, channel=1):
         """Stop playing the notes in NoteContainer nc."""
-        self.notify_listeners(self.MSG_PLAY_NC, {'notes': nc,
-            'channel': channel})
+        if self.MSG_PLAY_NC in self._get_subscriptions():
+            self.notify_listeners(self.MSG_PLAY_NC, {'notes': nc,
+                'channel': channel})
         if nc is None:
             return True
         for note in nc:
@@ -216,11 +416,15 @@ class Sequencer(object):
             self.stop_NoteContainer(nc[2], channel)
         return {'bpm': bpm}
 
-    def play_Bars(self, bars, channels, bpm=120):
+    def play_Bars(self, bars, channels, bpm=120, tempo_map=None, beat=0.0):
         """Play several bars (a list of Bar objects) at the same time.
 
         A list of channels should also be provided. The tempo can be changed
         by providing one or more of the NoteContainers with a bpm argument.
+
+        If a TempoMap is given, the durations are looked up in the map
+        instead, with beat the position of the bars in quarter notes from
+        the start of the map.
         """
         self.notify_listeners(self.MSG_PLAY_BARS, {'bars': bars,
             'channels': channels, 'bpm': bpm})
@@ -253,6 +457,10 @@ class Sequencer(object):
                 playing_new.sort()
                 shortest = playing_new[-1][0]
                 ms = qn_length * (4.0 / shortest)
+                if tempo_map is not None:
+                    begin = beat + tick * 4
+                    ms = tempo_map.beats_to_seconds(begin + 4.0 / shortest)\
+                         - tempo_map.beats_to_seconds(begin)
                 self.sleep(ms)
                 self.notify_listeners(self.MSG_SLEEP, {'s': ms})
             else:
@@ -264,6 +472,10 @@ class Sequencer(object):
                     playing.sort()
                     shortest = playing[-1][0]
                     ms = qn_length * (4.0 / shortest)
+                    if tempo_map is not None:
+                        begin = beat + tick * 4
+                        ms = tempo_map.beats_to_seconds(begin + 4.0
+                                / shortest) - tempo_map.beats_to_seconds(begin)
                     self.sleep(ms)
                     self.notify_listeners(self.MSG_SLEEP, {'s': ms})
                 else:
@@ -305,49 +517,198 @@ class Sequencer(object):
                 return {}
         return {'bpm': bpm}
 
-    def play_Tracks(self, tracks, channels, bpm=120):
+    def play_Tracks(self, tracks, channels, bpm=120, tempo_map=None):
         """Play a list of Tracks.
 
         If an instance of MidiInstrument is used then the instrument will be
         set automatically.
+
+        If a TempoMap is given, it is used for the timing instead of bpm.
         """
         self.notify_listeners(self.MSG_PLAY_TRACKS, {'tracks': tracks,
             'channels': channels, 'bpm': bpm})
 
         # Set the right instruments
         for x in range(len(tracks)):
-            instr = tracks[x].instrument
-            if isinstance(instr, MidiInstrument):
-                try:
-                    i = instr.names.index(instr.name)
-                except:
-                    i = 1
-                self.set_instrument(channels[x], i)
-            else:
-                self.set_instrument(channels[x], 1)
+            self.set_instrument(channels[x],
+                                instrument_number(tracks[x].instrument))
         current_bar = 0
         max_bar = len(tracks[0])
+        beat = 0.0
 
         # Play the bars
         while current_bar < max_bar:
             playbars = []
             for tr in tracks:
                 playbars.append(tr[current_bar])
-            res = self.play_Bars(playbars, channels, bpm)
+            res = self.play_Bars(playbars, channels, bpm, tempo_map, beat)
             if res != {}:
                 bpm = res['bpm']
             else:
                 return {}
+            beat += playbars[0].length * 4
             current_bar += 1
         return {'bpm': bpm}
 
-    def play_Composition(self, composition, channels=None, bpm=120):
-        """Play a Composition object."""
+    def play_Composition(self, composition, channels=None, bpm=120,
+                         scheduled=False):
+        """Play a Composition object.
+
+        If the composition has a tempo_map attribute, like the ones read by
+        midi_file_in, the tempo changes in that TempoMap are followed.
+
+        The composition is played bar by bar with play_Tracks, which sends
+        all the high level messages (MSG_PLAY_TRACKS, MSG_PLAY_NOTE, ...)
+        to the listeners. If scheduled is True, the composition is compiled
+        into a PlaybackPlan and played with play_Plan instead, which keeps
+        better time but only sends the low level messages; the timing
+        report is returned in the 'timing' key. A PlaybackPlan can be given
+        instead of a Composition to skip the compilation.
+        """
         self.notify_listeners(self.MSG_PLAY_COMPOSITION, {'composition'
                               : composition, 'channels': channels, 'bpm': bpm})
+        if isinstance(composition, PlaybackPlan):
+            return {'bpm': bpm, 'timing': self.play_Plan(composition)}
         if channels == None:
             channels = list(map(lambda x: x + 1, range(len(composition.tracks))))
-        return self.play_Tracks(composition.tracks, channels, bpm)
+        if scheduled:
+            plan = self.compile_Composition(composition, channels, bpm)
+            return {'bpm': bpm, 'timing': self.play_Plan(plan)}
+        return self.play_Tracks(composition.tracks, channels, bpm,
+                                getattr(composition, 'tempo_map', None))
+
+    def compile_Composition(self, composition, channels=None, bpm=120):
+        """Return a PlaybackPlan with all the events needed to play a
+        Composition.
+
+        The plan can be played any number of times with play_Plan or
+        play_Composition without walking the bars again.
+        """
+        return PlaybackPlan.from_Composition(composition, channels, bpm)
+
+    def play_Plan(self, plan, loops=1):
+        """Play a PlaybackPlan loops times in a row and return the timing
+        report of play_events. Every loop starts plan.length seconds after
+        the one before."""
+        return self.play_events(plan, loops, plan.length)
+
+    def play_events(self, events, loops=1, period=None):
+        """Play a sorted sequence of (seconds, kind, channel, param1, param2)
+        events, like a PlaybackPlan.
+
+        Every event is sent when clock() reaches its time (see clock),
+        measured from the moment play_events is called, so that the
+        overhead of sending the events and sleeping doesn't accumulate. The
+        events are played loops times, each time period seconds (by default
+        the time of the last event) later than the one before. In between,
+        the sequencer sleeps (see sleep).
+
+        Return a report on the timing: a dictionary with the number of
+        'events', the 'duration' of the playback in seconds, the 'mean' and
+        'max' absolute difference between the scheduled and the actual time
+        of the events, their standard deviation ('jitter') and the
+        difference at the last event ('drift').
+        """
+        if period is None:
+            period = events[-1][0] if len(events) else 0.0
+        clock = self.clock
+        start = clock()
+        n = 0
+        total = 0.0
+        total_abs = 0.0
+        total_sq = 0.0
+        largest = 0.0
+        error = 0.0
+        for loop in range(loops):
+            offset = start + loop * period
+            for (at, kind, channel, param1, param2) in events:
+                at += offset
+                delay = at - clock()
+                if delay > 0:
+                    self.sleep(delay)
+                    if self.MSG_SLEEP in self._get_subscriptions():
+                        self.notify_listeners(self.MSG_SLEEP, {'s': delay})
+                error = clock() - at
+                n += 1
+                total += error
+                total_abs += abs(error)
+                total_sq += error * error
+                if abs(error) > largest:
+                    largest = abs(error)
+                self.send_event(kind, channel, param1, param2)
+        return timing_report(n, total, total_abs, total_sq, largest, error,
+                             clock() - start)
+
+    def send_event(self, kind, channel, param1, param2):
+        """Send a single event from a PlaybackPlan (without its time)."""
+        if kind == EVENT_PLAY:
+            self.play_event(param1, channel, param2)
+            self._note_started(channel, param1)
+            if self.MSG_PLAY_INT in self._get_subscriptions():
+                self.notify_listeners(self.MSG_PLAY_INT, {'channel': channel,
+                        'note': param1, 'velocity': param2})
+        elif kind == EVENT_STOP:
+            self.stop_event(param1, channel)
+            self._note_stopped(channel, param1)
+            if self.MSG_STOP_INT in self._get_subscriptions():
+                self.notify_listeners(self.MSG_STOP_INT, {'channel': channel,
+                        'note': param1})
+        else:
+            self.set_instrument(channel, param1, param2)
+
+    def start(self, composition, channels=None, bpm=120):
+        """Start playing a Composition or PlaybackPlan in the background and
+        return the Transport that controls it.
+
+        The transport methods below (stop, pause, resume, seek, set_tempo
+        and loop) don't block; see mingus.midi.transport. A transport that
+        is still playing is stopped first.
+        """
+        if not isinstance(composition, PlaybackPlan):
+            composition = self.compile_Composition(composition, channels, bpm)
+        self.stop()
+        self.transport = Transport(self, composition)
+        self.transport.start()
+        return self.transport
+
+    def stop(self):
+        """Stop the background playback started with start.
+
+        Return False if nothing was playing.
+        """
+        transport = getattr(self, 'transport', None)
+        if transport is None or not transport.playing():
+            return False
+        transport.stop()
+        return True
+
+    def pause(self):
+        """Pause the background playback."""
+        return self._transport_command('pause')
+
+    def resume(self):
+        """Resume the background playback after pause."""
+        return self._transport_command('resume')
+
+    def seek(self, seconds):
+        """Continue the background playback from seconds."""
+        return self._transport_command('seek', seconds)
+
+    def set_tempo(self, bpm):
+        """Change the tempo of the background playback."""
+        return self._transport_command('set_tempo', bpm)
+
+    def loop(self, start=None, end=None):
+        """Loop the background playback between start and end seconds, or
+        turn looping off if no arguments are given."""
+        return self._transport_command('loop', start, end)
+
+    def _transport_command(self, name, *args):
+        transport = getattr(self, 'transport', None)
+        if transport is None or not transport.playing():
+            return False
+        getattr(transport, name)(*args)
+        return True
 
     def modulation(self, channel, value):
         """Set the modulation."""
@@ -81,6 +81,9 @@ class SequencerObserver(object):
     def play_Composition(self, composition, channels, bpm):
         pass
 
+    def stop_everything(self, notes):
+        pass
+
     def notify(self, msg_type, params):
         if msg_type == Sequencer.MSG_PLAY_INT:
             self.play_int_note_event(params['note'], params['channel'],
@@ -114,4 +117,6 @@ class SequencerObserver(object):
         elif msg_type == Sequencer.MSG_PLAY_COMPOSITION:
             self.play_Composition(params['composition'], params['channels'],
                     params['bpm'])
+        elif msg_type == Sequencer.MSG_STOP_ALL:
+            self.stop_everything(params['notes'])
 
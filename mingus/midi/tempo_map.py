@@ -0,0 +1,117 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+#    mingus - Music theory Python package, tempo_map module.
+#    Copyright (C) 2008-2009, Bart Spaans
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Convert between MIDI ticks and seconds in pieces with tempo changes.
+
+MIDI files store the tempo as Set Tempo meta events, in microseconds per
+quarter note, that can occur at any tick. A TempoMap keeps all of these
+changes together with the time in seconds at which each one starts, so that
+looking up the time of a tick (or the tick at a time) is a binary search
+instead of a walk over all the preceding changes.
+"""
+
+import bisect
+
+class TempoMap(object):
+
+    """A list of tempo changes that converts between ticks and seconds.
+
+    The tempo is stored in microseconds per quarter note (mpqn), like in
+    MIDI files. There is always a tempo at tick 0; it defaults to 120 bpm.
+    """
+
+    ticks_per_beat = 96
+
+    def __init__(self, ticks_per_beat=96, bpm=120):
+        self.ticks_per_beat = ticks_per_beat
+        self.ticks = [0]
+        self.mpqn = [int(round(60000000.0 / bpm))]
+        self.seconds = [0.0]
+
+    def set_tempo(self, tick, mpqn):
+        """Set the tempo from tick on to mpqn microseconds per quarter
+        note."""
+        i = bisect.bisect_right(self.ticks, tick) - 1
+        if i >= 0 and self.ticks[i] == tick:
+            self.mpqn[i] = mpqn
+        else:
+            i += 1
+            self.ticks.insert(i, tick)
+            self.mpqn.insert(i, mpqn)
+            self.seconds.insert(i, 0.0)
+        self._update_seconds(max(i, 1))
+
+    def set_bpm(self, tick, bpm):
+        """Set the tempo from tick on to bpm beats per minute."""
+        self.set_tempo(tick, int(round(60000000.0 / bpm)))
+
+    def _update_seconds(self, start):
+        """Recalculate the start times of the changes from index start on.
+
+        Changes are usually added in order, in which case only the last
+        start time has to be calculated.
+        """
+        for i in range(start, len(self.ticks)):
+            self.seconds[i] = self.seconds[i - 1] + (self.ticks[i]
+                    - self.ticks[i - 1]) * self.mpqn[i - 1] / (1000000.0
+                    * self.ticks_per_beat)
+
+    def tick_to_seconds(self, tick):
+        """Return the time in seconds at which tick occurs."""
+        i = max(bisect.bisect_right(self.ticks, tick) - 1, 0)
+        return self.seconds[i] + (tick - self.ticks[i]) * self.mpqn[i]\
+             / (1000000.0 * self.ticks_per_beat)
+
+    def seconds_to_tick(self, seconds):
+        """Return the (fractional) tick that occurs at the given time."""
+        i = max(bisect.bisect_right(self.seconds, seconds) - 1, 0)
+        return self.ticks[i] + (seconds - self.seconds[i]) * (1000000.0
+                * self.ticks_per_beat) / self.mpqn[i]
+
+    def beats_to_seconds(self, beats):
+        """Return the time in seconds at which the given number of quarter
+        notes have passed."""
+        return self.tick_to_seconds(beats * self.ticks_per_beat)
+
+    def tempo_at(self, tick):
+        """Return the tempo at tick in microseconds per quarter note."""
+        return self.mpqn[max(bisect.bisect_right(self.ticks, tick) - 1, 0)]
+
+    def bpm_at(self, tick):
+        """Return the tempo at tick in beats per minute."""
+        return 60000000.0 / self.tempo_at(tick)
+
+    def __iter__(self):
+        """Iterate over the (tick, mpqn) tempo changes."""
+        return iter(zip(self.ticks, self.mpqn))
+
+    def __len__(self):
+        return len(self.ticks)
+
+    def __eq__(self, other):
+        if not isinstance(other, TempoMap):
+            return False
+        return self.ticks_per_beat == other.ticks_per_beat and list(self)\
+             == list(other)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __repr__(self):
+        return '<TempoMap %s>' % list(self)
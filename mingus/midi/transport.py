@@ -0,0 +1,262 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+#    mingus - Music theory Python package, transport module.
+#    Copyright (C) 2008-2009, Bart Spaans
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Play a PlaybackPlan in the background and control it while it plays.
+
+A Transport plays the events of a plan on a Sequencer from a worker thread.
+The methods that control it (stop, pause, resume, seek, set_tempo and loop)
+don't block: they put a command on a queue that the worker reads while it
+waits for the next event, so a command takes effect as soon as the worker
+wakes up. The time between sending and handling every command is kept, see
+latency.
+
+Usually a Transport is made with Sequencer.start.
+"""
+
+from mingus.midi.playback_plan import EVENT_INSTR
+import threading
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+class Transport(object):
+
+    """Plays a PlaybackPlan on a Sequencer from a worker thread."""
+
+    def __init__(self, sequencer, plan):
+        self.sequencer = sequencer
+        self.plan = plan
+        self.bpm = plan.tempo_map.bpm_at(0)
+        self.commands = queue.Queue()
+        # (number of commands, total latency, max latency); replaced as a
+        # whole by the worker, like _anchor
+        self._latency = (0, 0.0, 0.0)
+        self.loop_region = None
+        self.paused = False
+        # (clock time, plan time, rate): the plan time at a clock time and
+        # the speed at which the plan is played from there on. The worker
+        # replaces the whole tuple, so that position() always reads a
+        # consistent one.
+        self._anchor = (0.0, 0.0, 1.0)
+        self._thread = None
+        # The program changes, replayed when the transport jumps
+        self._programs = [e for e in plan if e[1] == EVENT_INSTR]
+
+    def start(self):
+        """Start playing from the beginning of the plan."""
+        self._anchor = (self.sequencer.clock(), 0.0, 1.0)
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def playing(self):
+        """Return True if the worker thread is running."""
+        return self._thread is not None and self._thread.is_alive()
+
+    def position(self):
+        """Return the position in the plan in seconds."""
+        (clock, at, rate) = self._anchor
+        if self.paused:
+            return at
+        return at + (self.sequencer.clock() - clock) * rate
+
+    def sync(self):
+        """Wait until the worker has handled all the commands sent so far,
+        or has finished."""
+        done = self.commands.all_tasks_done
+        done.acquire()
+        try:
+            while self.commands.unfinished_tasks and self.playing():
+                done.wait(0.01)
+        finally:
+            done.release()
+
+    def wait(self, timeout=None):
+        """Wait until the plan has been played or stopped. Return True if it
+        has."""
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return not self.playing()
+
+    def stop(self):
+        """Stop playing, release the notes that are playing and wait for the
+        worker to finish."""
+        self._send('stop')
+        self.wait()
+
+    def pause(self):
+        """Pause playback; the notes that are playing are released."""
+        self._send('pause')
+
+    def resume(self):
+        """Continue playing after pause."""
+        self._send('resume')
+
+    def seek(self, seconds):
+        """Continue playing from the given position in the plan."""
+        self._send('seek', seconds)
+
+    def set_tempo(self, bpm):
+        """Play at bpm beats per minute.
+
+        Tempo changes in the plan are scaled with it: the plan is played
+        bpm / (the tempo at the start of the plan) times as fast.
+        """
+        self._send('tempo', float(bpm) / self.bpm)
+
+    def loop(self, start=None, end=None):
+        """Play the part of the plan between start and end (in seconds) over
+        and over again. Without arguments, looping is turned off. If end is
+        None, the loop ends at the end of the plan (see
+        PlaybackPlan.length).
+
+        Raise a ValueError unless 0 <= start < end <= the length of the
+        plan.
+        """
+        if start is None and end is None:
+            self._send('loop', None)
+            return
+        start = start or 0.0
+        length = self.plan.length
+        if end is None:
+            end = length
+        if not 0 <= start < end <= length:
+            raise ValueError('The loop should be a part of the plan '
+                             '(0-%g seconds), not %g-%g.' % (length,
+                             start, end))
+        self._send('loop', (start, end))
+
+    def latency(self):
+        """Return a dictionary with the number of handled 'commands' and
+        the 'mean' and 'max' time in seconds between sending and handling
+        them."""
+        (count, total, longest) = self._latency
+        if not count:
+            return {'commands': 0, 'mean': 0.0, 'max': 0.0}
+        return {'commands': count, 'mean': total / count, 'max': longest}
+
+    def _send(self, command, argument=None):
+        self.commands.put((command, argument, self.sequencer.clock()))
+
+    def _release(self):
+        if self.sequencer.sounding:
+            self.sequencer.stop_everything()
+
+    def _run(self):
+        try:
+            self._play()
+        finally:
+            # Commands that arrive too late are never handled
+            while True:
+                try:
+                    self.commands.get_nowait()
+                except queue.Empty:
+                    break
+                self.commands.task_done()
+
+    def _play(self):
+        seq = self.sequencer
+        clock = seq.clock
+        events = tuple(self.plan)
+        i = 0
+        while True:
+            # Work out when the worker has to do something next: send the
+            # next event or jump back to the start of the loop
+            (anchor, at, rate) = self._anchor
+            deadline = None
+            event_due = False
+            if not self.paused:
+                stop = None
+                if self.loop_region is not None:
+                    stop = self.loop_region[1]
+                if stop is not None and (i >= len(events) or events[i][0]
+                         >= stop):
+                    if self.position() >= stop:
+                        i = self._seek(self.loop_region[0], clock())
+                        continue
+                    deadline = anchor + (stop - at) / rate
+                elif i >= len(events):
+                    return
+                else:
+                    deadline = anchor + (events[i][0] - at) / rate
+                    event_due = deadline <= clock()
+            if event_due and self.commands.empty():
+                seq.send_event(*events[i][1:])
+                i += 1
+                continue
+            if deadline is not None and not seq.realtime and \
+                    self.commands.empty():
+                # The clock of the sequencer only moves while it sleeps; a
+                # microsecond more makes sure the deadline has passed
+                seq.sleep(max(deadline - clock(), 0.0) + 1e-6)
+                continue
+
+            # Wait for a command until the deadline
+            try:
+                if deadline is None:
+                    (command, argument, sent) = self.commands.get()
+                else:
+                    (command, argument, sent) = self.commands.get(True,
+                            max(deadline - clock(), 0.0))
+            except queue.Empty:
+                continue
+            now = clock()
+            (count, total, longest) = self._latency
+            self._latency = (count + 1, total + now - sent, max(longest, now
+                             - sent))
+            try:
+                if command == 'stop':
+                    self._release()
+                    return
+                elif command == 'pause' and not self.paused:
+                    self._anchor = (now, self.position(), rate)
+                    self.paused = True
+                    self._release()
+                elif command == 'resume' and self.paused:
+                    self._anchor = (now, at, rate)
+                    self.paused = False
+                elif command == 'seek':
+                    i = self._seek(argument, now)
+                elif command == 'tempo':
+                    self._anchor = (now, self.position(), argument)
+                elif command == 'loop':
+                    self.loop_region = argument
+            finally:
+                self.commands.task_done()
+
+    def _seek(self, seconds, now):
+        """Release the notes, move to seconds and return the index of the
+        next event.
+
+        The last program change before seconds on every channel is sent
+        again, so that the music continues with the right instruments.
+        """
+        self._release()
+        i = self.plan.index(seconds)
+        programs = {}
+        for e in self._programs:
+            if e[0] >= seconds:
+                break
+            programs[e[2]] = e
+        for channel in sorted(programs):
+            self.sequencer.send_event(*programs[channel][1:])
+        self._anchor = (now, seconds, self._anchor[2])
+        return i
@@ -0,0 +1,127 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+#    mingus - Music theory Python package, varbyte module.
+#    Copyright (C) 2008-2009, Bart Spaans
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Encode and decode the variable length quantities used in MIDI files.
+
+MIDI files store delta times and some lengths as variable length bytes: the
+value is split into groups of 7 bits, stored big-endian (most significant
+group first), and the highest bit (mask 0x80) of every byte but the last is
+set to indicate that more bytes follow. A value takes at most four bytes.
+
+The encodings of all the values that fit in two bytes, which covers nearly
+every delta time in practice, are looked up in a table.
+"""
+
+from struct import pack
+
+# The largest value that fits in four bytes
+MAX_VALUE = 0x0FFFFFFF
+
+def _encode(value):
+    """Encode value without using the table."""
+    result = [value & 0x7F]
+    value >>= 7
+    while value:
+        result.append(value & 0x7F | 0x80)
+        value >>= 7
+    result.reverse()
+    return pack('%dB' % len(result), *result)
+
+_table = [_encode(x) for x in range(0x4000)]
+
+def length(value):
+    """Return the number of bytes needed to encode value."""
+    return max(1, (value.bit_length() + 6) // 7)
+
+def encode(value):
+    """Return value as a variable length byte string.
+
+    Raise a ValueError if the value is negative or doesn't fit in four
+    bytes.
+    """
+    try:
+        if 0 <= value < 0x4000:
+            return _table[value]
+    except TypeError:
+        pass
+    value = int(value)
+    if value < 0 or value > MAX_VALUE:
+        raise ValueError('%d does not fit in a variable length byte.'
+                % value)
+    if value < 0x4000:
+        return _table[value]
+    return _encode(value)
+
+def encode_all(values):
+    """Encode an iterable of values, like a list or array of delta times,
+    and return the concatenated bytes."""
+    table = _table
+    return b''.join([(table[v] if 0 <= v < 0x4000 else encode(v)) for v in
+                    values])
+
+def decode(data, pos=0):
+    """Decode the variable length byte at offset pos of data.
+
+    The data should return integers when indexed, like a bytearray. Return
+    the value and the offset of the byte after it.
+    """
+    b = data[pos]
+    pos += 1
+    value = b & 0x7F
+    while b & 0x80:
+        b = data[pos]
+        pos += 1
+        value = (value << 7) | (b & 0x7F)
+    return (value, pos)
+
+def decode_all(data, pos=0, end=None):
+    """Decode all the consecutive variable length bytes between the offsets
+    pos and end of data and return the values in a list."""
+    if end is None:
+        end = len(data)
+    result = []
+    append = result.append
+    while pos < end:
+        b = data[pos]
+        pos += 1
+        value = b & 0x7F
+        while b & 0x80:
+            b = data[pos]
+            pos += 1
+            value = (value << 7) | (b & 0x7F)
+        append(value)
+    return result
+
+def read(fp):
+    """Read a variable length byte from the file object fp.
+
+    Return the value and the number of bytes read. Raise an IOError if the
+    file ends before the value does.
+    """
+    value = 0
+    bytes_read = 0
+    b = 0x80
+    while b & 0x80:
+        c = fp.read(1)
+        if not c:
+            raise IOError("Couldn't read variable length byte from file.")
+        b = bytearray(c)[0]
+        value = (value << 7) | (b & 0x7F)
+        bytes_read += 1
+    return (value, bytes_read)
@@ -0,0 +1,96 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+#    mingus - Music theory Python package, benchmark_midi_file_in module.
+#    Copyright (C) 2008-2009, Bart Spaans
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Compare the speed of the MIDI file parsers in mingus.midi.midi_file_in.
+
+Usage: benchmark_midi_file_in.py [file.mid ...]
+
+When no files are given, a test file with a few thousand bars is generated
+with mingus.midi.midi_file_out. For every parser the number of parsed
+events per second is printed.
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                '..'))
+
+from mingus.containers import Bar, Track, Composition
+from mingus.midi import midi_file_in, midi_file_out
+
+def generate_file(bars=2000):
+    """Write a two track composition to a temporary file and return its
+    name."""
+    c = Composition()
+    for notes in [['C', 'E', 'G', 'B'], ['A', 'C', 'E', 'G']]:
+        t = Track()
+        for i in range(bars):
+            b = Bar()
+            for n in notes:
+                b + n
+            t + b
+        c.add_track(t)
+    (fd, file) = tempfile.mkstemp(suffix='.mid')
+    os.close(fd)
+    midi_file_out.write_Composition(file, c)
+    return file
+
+def benchmark(parse, files, repeat=3):
+    """Return the best events per second rate of parse over files."""
+    best = None
+    for i in range(repeat):
+        events = 0
+        start = time.time()
+        for file in files:
+            (header, tracks) = parse(file)
+            for t in tracks:
+                if isinstance(t, tuple):
+                    # (events, meta) as returned by MIDI_to_arrays
+                    t = t[0]
+                events += len(t)
+        rate = events / max(time.time() - start, 1e-9)
+        if best is None or rate > best:
+            best = rate
+    return best
+
+def main(files):
+    generated = None
+    if not files:
+        generated = generate_file()
+        files = [generated]
+    m = midi_file_in.MidiFile()
+    try:
+        for (name, parse) in [('parse_midi_file', m.parse_midi_file),
+                              ('parse_midi_file_buffered',
+                               m.parse_midi_file_buffered),
+                              ('parse_midi_file_arrays',
+                               m.parse_midi_file_arrays),
+                              ('parse_midi_file_parallel',
+                               lambda f: m.parse_midi_file_parallel(f, None,
+                               True))]:
+            print('%-28s %12.0f events/s' % (name, benchmark(parse, files)))
+    finally:
+        if generated is not None:
+            os.remove(generated)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -44,7 +44,16 @@ import test_track
 import test_composition
 import test_suite
 
-# MIDI TESTS HERE ...
+# mingus.midi Tests
+
+import test_midi_file_in
+import test_midi_file_out
+import test_midi_track
+import test_tempo_map
+import test_varbyte
+import test_sequencer
+import test_transport
+import test_async_sequencer
 
 import test_fft
 import test_tablature
@@ -75,6 +84,16 @@ containers = [
     test_composition,
     test_suite,
     ]
+midi = [
+    test_midi_file_in,
+    test_midi_file_out,
+    test_midi_track,
+    test_tempo_map,
+    test_varbyte,
+    test_sequencer,
+    test_transport,
+    test_async_sequencer,
+    ]
 extra = [
         test_fft, 
         test_tunings, 
@@ -84,5 +103,5 @@ extra = [
 
 # Run all tests
 
-suite = unittest.TestSuite([x.suite() for x in core + containers + extra])
+suite = unittest.TestSuite([x.suite() for x in core + containers + midi + extra])
 unittest.TextTestRunner(verbosity=2).run(suite)
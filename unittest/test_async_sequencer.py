@@ -0,0 +1,137 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import sys
+sys.path += ['../']
+from mingus.containers import *
+from mingus.midi.sequencer import Sequencer
+import types
+import unittest
+try:
+    import asyncio
+    from mingus.midi.async_sequencer import AsyncSequencer
+except (ImportError, SyntaxError):
+    asyncio = None
+    AsyncSequencer = object
+
+
+class RecordingAsyncSequencer(AsyncSequencer):
+
+    def init(self):
+        self.events = []
+
+    def play_event(self, note, channel, velocity):
+        self.events.append(('play', note, channel, self.clock()))
+
+    def stop_event(self, note, channel):
+        self.events.append(('stop', note, channel, self.clock()))
+
+
+@unittest.skipIf(asyncio is None, 'asyncio is not available')
+class test_AsyncSequencer(unittest.TestCase):
+
+    def setUp(self):
+        t = Track()
+        b = Bar()
+        b + 'C'
+        b + 'E'
+        b + 'G'
+        b + 'C'
+        t + b
+        self.c = Composition()
+        self.c.add_track(t)
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_play_Composition(self):
+        s = RecordingAsyncSequencer(self.loop)
+        start = self.loop.time()
+        result = self.loop.run_until_complete(s.play_Composition(self.c,
+                bpm=6000))
+        self.assertEqual(9, result['timing']['events'])
+        self.assertEqual([60, 64, 67, 60], [e[1] for e in s.events if e[0]
+                         == 'play'])
+        times = [e[3] - start for e in s.events if e[0] == 'play']
+        for (i, t) in enumerate(times):
+            self.assertTrue(t >= i * 0.01)
+        self.assertTrue(result['timing']['max'] < 0.05)
+
+    def test_concurrent(self):
+        sequencers = [RecordingAsyncSequencer(self.loop) for i in range(20)]
+        futures = [s.play_Composition(self.c, bpm=6000) for s in
+                   sequencers]
+        start = self.loop.time()
+        self.loop.run_until_complete(asyncio.gather(*futures))
+        self.assertTrue(self.loop.time() - start < 0.5)
+        for s in sequencers:
+            self.assertEqual(8, len(s.events))
+            self.assertEqual({}, s.sounding)
+
+    def test_cancel(self):
+        s = RecordingAsyncSequencer(self.loop)
+        f = s.play_Composition(self.c, bpm=60)
+        stopped = []
+        self.loop.call_later(0.05, lambda : stopped.append(s.stop()))
+        self.assertRaises(asyncio.CancelledError,
+                          self.loop.run_until_complete, f)
+        self.assertEqual([True], stopped)
+        self.assertEqual([('play', 60, 1), ('stop', 60, 1)], [e[:3] for e in
+                         s.events])
+        self.assertEqual({}, s.sounding)
+        self.assertFalse(s.stop())
+
+    def test_listen(self):
+        s = RecordingAsyncSequencer(self.loop)
+        received = []
+
+        class Listener(object):
+
+            @types.coroutine
+            def notify(self, msg_type, params):
+                yield
+                received.append(msg_type)
+
+        s.attach(Listener(), [Sequencer.MSG_STOP_INT])
+        queue = s.listen([Sequencer.MSG_PLAY_INT])
+        self.loop.run_until_complete(s.play_Plan(s.compile_Composition(self.c,
+                                     bpm=6000), 2))
+        self.loop.run_until_complete(asyncio.sleep(0.01))
+        messages = []
+        while not queue.empty():
+            messages.append(queue.get_nowait())
+        self.assertEqual(8, len(messages))
+        self.assertEqual((Sequencer.MSG_PLAY_INT, {'channel': 1, 'note': 60,
+                         'velocity': 64}), messages[0])
+        self.assertEqual([Sequencer.MSG_STOP_INT] * 8, received)
+        self.assertTrue(s.unlisten(queue))
+        self.assertEqual(1, len(s.listeners))
+
+    def test_running_loop(self):
+        s = RecordingAsyncSequencer()
+        self.assertRaises(RuntimeError, s.clock)
+
+        results = []
+
+        @types.coroutine
+        def play():
+            f = s.play_Composition(self.c, bpm=6000)
+            while not f.done():
+                yield
+            results.append(f.result())
+        self.loop.run_until_complete(play())
+        self.assertEqual(9, results[0]['timing']['events'])
+        self.assertTrue(s.get_loop() is self.loop)
+        self.assertTrue(s.clock() <= self.loop.time())
+
+    def test_transport(self):
+        s = RecordingAsyncSequencer(self.loop)
+        self.assertRaises(NotImplementedError, s.start, self.c)
+        self.assertRaises(NotImplementedError, s.pause)
+        self.assertRaises(NotImplementedError, s.seek, 1.0)
+        self.assertRaises(NotImplementedError, s.loop, 0.0, 1.0)
+        self.assertFalse(s.stop())
+
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(test_AsyncSequencer)
@@ -3,6 +3,10 @@
 import sys
 sys.path += ['../']
 import unittest
+import numpy
+import os
+import struct
+import tempfile
 import mingus.extra.fft as fft
 from mingus.containers import *
 
@@ -17,10 +21,127 @@ class test_fft(unittest.TestCase):
         self.assertEqual(Note('A'), fft.find_Note(self.data, self.freq,
                          self.bits))
 
+    def test_find_spectrum(self):
+        (frequencies, amplitudes) = fft.find_spectrum(self.data[:4096],
+                self.freq, self.bits)
+        self.assertEqual(2049, len(frequencies))
+        self.assertEqual(len(frequencies), len(amplitudes))
+        self.assertAlmostEqual(self.freq / 2.0, frequencies[-1])
+        self.assertTrue(abs(frequencies[amplitudes.argmax()] - 440) < 11)
+        self.assertEqual(list(zip(frequencies, amplitudes)),
+                         fft.find_frequencies(self.data[:4096], self.freq,
+                         self.bits))
+
+    def test_find_note_amplitudes(self):
+        data = self.data[:1024]
+        amplitudes = fft.find_note_amplitudes(data, self.freq, self.bits)
+        notes = fft.find_notes(fft.find_frequencies(data, self.freq,
+                               self.bits))
+        self.assertEqual(129, len(amplitudes))
+        self.assertEqual(Note('A-4'), notes[amplitudes.argmax()][0])
+        for (x, (note, amplitude)) in enumerate(notes):
+            self.assertAlmostEqual(amplitude, amplitudes[x])
+        self.assertEqual(None, fft.find_Note([0] * 512, self.freq,
+                         self.bits))
+
+    def test_find_notes_iterator(self):
+        table = fft.find_frequencies(self.data[:1024], self.freq, self.bits)
+        self.assertEqual(fft.find_notes(table), fft.find_notes(iter(table)))
+
+    def test_pitch_map_cache(self):
+        for n in range(100, 200):
+            fft.find_note_amplitudes(self.data[:n], self.freq, self.bits)
+        self.assertTrue(len(fft._pitch_maps) <= fft._max_pitch_maps)
+
+    def test_chunk_view(self):
+        data = numpy.arange(10)
+        chunks = fft.chunk_view(data, 4, 3)
+        self.assertEqual([[0, 1, 2, 3], [3, 4, 5, 6], [6, 7, 8, 9]],
+                         chunks.tolist())
+        self.assertTrue(numpy.may_share_memory(data, chunks))
+        self.assertEqual((0, 4), fft.chunk_view(data[:3], 4).shape)
+
+    def test_analyze_chunks(self):
+        chunks = fft.analyze_chunks(self.data[:5000], self.freq, self.bits,
+                                    512)
+        self.assertEqual(10, len(chunks))
+        self.assertEqual([Note('A-4')] * 9, chunks[:9])
+        chunks = fft.analyze_chunks(self.data[:5000], self.freq, self.bits,
+                                    1024, 256, 'hann', batch=4)
+        self.assertEqual(17, len(chunks))
+        self.assertEqual([Note('A-4')] * 16, chunks[:16])
+        self.assertRaises(ValueError, fft.analyze_chunks, self.data,
+                          self.freq, self.bits, 512, None, 'square')
+
+    def _write_wav(self, tag, width, samples):
+        samples = numpy.asarray(samples)
+        if width == 3:
+            b = samples.astype('<i4').view(numpy.uint8).reshape(-1, 4)
+            data = b[:, :3].tobytes()
+        elif width == 1:
+            data = (samples + 128).astype(numpy.uint8).tobytes()
+        else:
+            data = samples.astype(fft._sample_types[(tag, width)]).tobytes()
+        channels = samples.shape[1]
+        (fd, name) = tempfile.mkstemp(suffix='.wav')
+        os.write(fd, b'RIFF' + struct.pack('<I', 36 + len(data)) + b'WAVE'
+                 + b'fmt ' + struct.pack('<IHHIIHH', 16, tag, channels,
+                 8000, 8000 * width * channels, width * channels, width
+                 * 8) + b'data' + struct.pack('<I', len(data)) + data)
+        os.close(fd)
+        self.addCleanup(os.remove, name)
+        return name
+
+    def test_data_from_file_formats(self):
+        samples = numpy.array([[0, 1], [-5, 7], [100, -100], [-128, 127]])
+        for (tag, width, scale) in [(1, 1, 1), (1, 2, 256), (1, 3, 65536),
+                                    (1, 4, 1 << 24), (3, 4, 0.5), (3, 8,
+                                    0.25)]:
+            name = self._write_wav(tag, width, samples * scale)
+            for mmap in [False, True]:
+                for channel in [0, 1, None]:
+                    (data, freq, bits) = fft.data_from_file(name, channel,
+                            mmap, block=3)
+                    self.assertEqual(8000, freq)
+                    self.assertEqual(width, bits)
+                    if channel is None:
+                        expected = samples.mean(axis=1)
+                    else:
+                        expected = samples[:, channel]
+                    self.assertEqual(list(expected * scale), list(data))
+        self.assertRaises(ValueError, fft.data_from_file, name, 2)
+
+    def test_data_from_file_mmap(self):
+        (data, freq, bits) = fft.data_from_file('440_sine_clean.wav',
+                mmap=True)
+        self.assertTrue(isinstance(data, numpy.memmap))
+        self.assertEqual(list(self.data), list(data))
+        self.assertEqual(Note('A'), fft.find_Note(data, freq, bits))
+
     def test_find_melody(self):
         self.assertEqual([(Note('A-4'), 86), (Note('A-5'), 86)],
                          fft.find_melody('440_880_clean.wav', 512)[:2])
 
+    def test_iter_melody(self):
+        melody = fft.iter_melody('440_880_clean.wav', 512, block=1000)
+        self.assertEqual((Note('A-4'), 86), next(melody))
+        self.assertEqual(fft.find_melody('440_880_clean.wav', 512)[1:],
+                         list(melody))
+        (data, freq, bits) = fft.data_from_file('440_880_clean.wav')
+        f = open('440_880_clean.wav', 'rb')
+        self.assertEqual(fft.analyze_chunks(data, freq, bits, 1024, 256,
+                         'hann'), list(fft.iter_chunks(f, 1024, 256, 'hann',
+                         block=3000)))
+        f.close()
+
+    def test_iter_chunks_long_hop(self):
+        expected = fft.analyze_chunks(self.data, self.freq, self.bits, 512,
+                                      1500)
+        self.assertEqual(30, len(expected))
+        for block in [100, 1000, 1500, 4000]:
+            self.assertEqual(expected, list(fft.iter_chunks(
+                             '440_sine_clean.wav', 512, 1500, block=block)))
+
 
 def suite():
     return unittest.TestLoader().loadTestsFromTestCase(test_fft)
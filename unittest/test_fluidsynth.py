@@ -1,7 +1,9 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
+import io
 import os
 import sys
+import wave
 
 this_dir = os.path.dirname(os.path.realpath(__file__))
 
@@ -171,6 +173,122 @@ class test_fluidsynth(unittest.TestCase):
         c + t2
         self.assert_(fluidsynth.play_Composition(c))
 
+    def test_get_samples_out(self):
+        import numpy
+        synth = fluidsynth.midi.fs
+        out = numpy.zeros(4096, numpy.int16)
+        samples = synth.get_samples(1024, out)
+        self.assertEqual(2048, len(samples))
+        self.assert_(numpy.may_share_memory(samples, out))
+        out = numpy.zeros(2048, numpy.float32)
+        samples = synth.get_samples_float(1024, out)
+        self.assert_(numpy.may_share_memory(samples, out))
+        self.assertRaises(ValueError, synth.get_samples, 1024, out)
+        self.assertRaises(ValueError, synth.get_samples_float, 2048, out)
+
+    def test_render_Composition(self):
+        b = Bar()
+        b + Note('C')
+        b + Note('E')
+        b + Note('G')
+        b + 'E'
+        t = Track()
+        t + b
+        t + b
+        c = Composition()
+        c + t
+        f = io.BytesIO()
+        report = fluidsynth.render_Composition(c, f, bpm=120)
+        self.assertEqual(5 * 44100, report['frames'])
+        self.assert_(report['realtime_factor'] > 1.0)
+        f.seek(0)
+        w = wave.open(f)
+        self.assertEqual(5 * 44100, w.getnframes())
+
+    def test_render_Composition_rest(self):
+        b = Bar()
+        b + Note('C')
+        r = Bar()
+        r.place_rest(1)
+        t = Track()
+        t + b
+        t + r
+        c = Composition()
+        c + t
+        report = fluidsynth.render_Composition(c, io.BytesIO(), bpm=120)
+        self.assertEqual(5 * 44100, report['frames'])
+        report = fluidsynth.render_Composition_parallel(c, io.BytesIO(),
+                '/usr/share/sounds/sf2/FluidR3_GM.sf2', tail=0.5)
+        self.assertEqual(int(4.5 * 44100), report['frames'])
+
+    def test_start_recording(self):
+        b = Bar()
+        b + Note('C')
+        b + Note('E')
+        c = Composition()
+        c + Track().add_bar(b)
+        transport = fluidsynth.midi.start(c, bpm=120)
+        self.assert_(transport.wait(5))
+        self.assert_(fluidsynth.midi.clock() >= 1.0)
+
+    def test_render_Composition_parallel(self):
+        b = Bar()
+        b + Note('C')
+        b + Note('E')
+        b + Note('G')
+        b + 'E'
+        c = Composition()
+        for i in range(3):
+            t = Track()
+            t + b
+            c + t
+        f = io.BytesIO()
+        report = fluidsynth.render_Composition_parallel(c, f,
+                '/usr/share/sounds/sf2/FluidR3_GM.sf2', gains=[1.0, 0.5,
+                0.5], pans=[0.0, -1.0, 1.0], processes=2)
+        self.assertEqual(3 * 44100, report['frames'])
+        self.assertEqual(3, len(report['stem_peaks']))
+        self.assert_(report['peak'] > 0.0)
+        f.seek(0)
+        self.assertEqual(3 * 44100, wave.open(f).getnframes())
+
+    def test_FluidSynthScheduler(self):
+        b = Bar()
+        b + Note('C')
+        b + Note('E')
+        b + Note('G')
+        b + 'E'
+        t = Track()
+        for i in range(4):
+            t + b
+        scheduler = fluidsynth.FluidSynthScheduler(lookahead=0.5)
+        events = scheduler.compile(fluidsynth.PlaybackPlan.from_Track(t))
+        self.assertEqual(16, len(events))
+        self.assertEqual((0, 'note', 1, 60, 64, 500), events[0])
+        scheduler.play(t)
+        self.assertEqual(8000, scheduler.end)
+        self.assert_(scheduler.playing())
+        self.assert_(scheduler.index < len(events))
+        fluidsynth.midi.fs.get_samples(44100 * 9)
+        self.assertFalse(scheduler.playing())
+        self.assert_(scheduler.batches > 1)
+        scheduler.stop()
+
+    def test_FluidSynthScheduler_stop(self):
+        t = Track()
+        for i in range(4):
+            t + 'C'
+        scheduler = fluidsynth.FluidSynthScheduler(lookahead=0.5)
+        scheduler.play(t)
+        batches = scheduler.batches
+        scheduler.stop()
+        self.assertFalse(scheduler.playing())
+
+        # A callback that was already on its way does nothing
+        scheduler._callback(0, None, None, None)
+        self.assertEqual(batches, scheduler.batches)
+        self.assertEqual([], scheduler.events)
+
 
 def suite():
     return unittest.TestLoader().loadTestsFromTestCase(test_fluidsynth)
@@ -0,0 +1,238 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import sys
+sys.path += ['../']
+import os
+import struct
+import tempfile
+import mingus.midi.midi_file_in as midi_file_in
+import mingus.midi.midi_file_out as midi_file_out
+from mingus.midi.tempo_map import TempoMap
+from mingus.containers import *
+import unittest
+
+
+class test_MidiFileIn(unittest.TestCase):
+
+    def setUp(self):
+        t = Track()
+        b = Bar()
+        b + 'C'
+        b + 'E'
+        b + ['C', 'E', 'G']
+        b + None
+        t + b
+        t + b
+        self.composition = Composition()
+        self.composition.add_track(t)
+        self.composition.add_track(t)
+        (fd, self.file) = tempfile.mkstemp(suffix='.mid')
+        os.close(fd)
+        midi_file_out.write_Composition(self.file, self.composition)
+
+    def tearDown(self):
+        os.remove(self.file)
+
+    def test_parse_midi_file_buffered(self):
+        m = midi_file_in.MidiFile()
+        self.assertEqual(m.parse_midi_file(self.file),
+                         m.parse_midi_file_buffered(self.file))
+
+    def test_parse_midi_data_header_error(self):
+        m = midi_file_in.MidiFile()
+        self.assertRaises(midi_file_in.HeaderError, m.parse_midi_data,
+                          bytearray(b'RIFF\x00\x00\x00\x06\x00\x01\x00\x01\x00H'))
+
+    def test_parse_midi_data_truncated(self):
+        f = open(self.file, 'rb')
+        data = bytearray(f.read())
+        f.close()
+        m = midi_file_in.MidiFile()
+        self.assertRaises(IOError, m.parse_midi_data, data[:-3])
+
+    def test_iter_events(self):
+        (header, tracks) = midi_file_in.MidiFile().parse_midi_file(self.file)
+        events = list(midi_file_in.iter_events(self.file))
+        self.assertEqual(sum([len(t) for t in tracks]), len(events))
+        self.assertEqual([e for (d, e) in tracks[1]], [e for (n, tick, e) in
+                         events if n == 1])
+        self.assertEqual(sum([d for (d, e) in tracks[0]]), [tick for (n,
+                         tick, e) in events if n == 0][-1])
+
+    def test_iter_events_merge(self):
+        events = list(midi_file_in.iter_events(self.file, merge=True))
+        ticks = [tick for (n, tick, e) in events]
+        self.assertEqual(sorted(ticks), ticks)
+        self.assertEqual(list(midi_file_in.iter_events(self.file, 1)), [e
+                         for e in events if e[0] == 1])
+
+    def test_iter_events_small_buffer(self):
+        events = list(midi_file_in.iter_events(self.file, merge=True))
+        size = midi_file_in._ChunkReader.buffer_size
+        midi_file_in._ChunkReader.buffer_size = 3
+        try:
+            self.assertEqual(events, list(midi_file_in.iter_events(self.file,
+                             merge=True)))
+        finally:
+            midi_file_in._ChunkReader.buffer_size = size
+
+    def test_MIDI_to_arrays(self):
+        (header, tracks) = midi_file_in.MidiFile().parse_midi_file(self.file)
+        (aheader, arrays) = midi_file_in.MIDI_to_arrays(self.file)
+        self.assertEqual(header, aheader)
+        (events, meta) = arrays[0]
+        self.assertEqual(len(tracks[0]), len(events))
+        self.assertEqual([d for (d, e) in tracks[0]], list(events['delta']))
+        self.assertEqual(sum([d for (d, e) in tracks[0]]), events['tick'][-1])
+        for (i, (d, e)) in enumerate(tracks[0]):
+            if e['event'] == 0x0f:
+                self.assertEqual(e['meta_event'], events['p1'][i])
+                self.assertEqual(e['data'], meta[i])
+            else:
+                self.assertEqual((e['event'], e['channel'], e['param1']),
+                                 (events['type'][i], events['channel'][i],
+                                 events['p1'][i]))
+
+    def test_parse_midi_file_parallel(self):
+        m = midi_file_in.MidiFile()
+        self.assertEqual(m.parse_midi_file(self.file),
+                         m.parse_midi_file_parallel(self.file, 2))
+        (header, arrays) = m.parse_midi_file_parallel(self.file, 2, True)
+        (header, expected) = m.parse_midi_file_arrays(self.file)
+        self.assertEqual(len(expected), len(arrays))
+        self.assertEqual(list(expected[1][0]), list(arrays[1][0]))
+        self.assertEqual(expected[1][1], arrays[1][1])
+
+    def test_track_events_to_Track(self):
+        # C and E start together, C is released early with a note on of
+        # velocity 0, G starts after a rest.
+        track = [[0, {'event': 9, 'channel': 0, 'param1': 60, 'param2': 90}],
+                 [0, {'event': 9, 'channel': 0, 'param1': 64, 'param2': 90}],
+                 [48, {'event': 9, 'channel': 0, 'param1': 60, 'param2': 0}],
+                 [48, {'event': 8, 'channel': 0, 'param1': 64, 'param2': 0}],
+                 [96, {'event': 9, 'channel': 0, 'param1': 67, 'param2': 80}],
+                 [192, {'event': 8, 'channel': 0, 'param1': 67, 'param2': 0}]]
+        t = midi_file_in.MidiFile().track_events_to_Track(track, 96)
+        self.assertEqual(1, len(t))
+        b = t[0]
+        self.assertEqual([0.0, 4.0], b[0][:2])
+        self.assertEqual(NoteContainer(['C', 'E']), b[0][2])
+        self.assertEqual(2, len(b[0][2]))
+        self.assertEqual(90, b[0][2][0].velocity)
+        self.assertEqual([0.25, 4.0, NoteContainer()], b[1])
+        self.assertEqual([0.5, 2.0], b[2][:2])
+        self.assertEqual([Note('G')], b[2][2].notes)
+
+        # Notes at the last tick without a note off last until the end of
+        # the bar
+        track = [[0, {'event': 9, 'channel': 9, 'param1': 60, 'param2': 90}],
+                 [96, {'event': 9, 'channel': 9, 'param1': 62, 'param2': 90}],
+                 [0, {'event': 0x0f, 'meta_event': 47, 'data': ''}]]
+        t = midi_file_in.MidiFile().track_events_to_Track(track, 96)
+        self.assertEqual(1, len(t))
+        self.assertEqual([0.0, 4.0, NoteContainer(['C'])], t[0][0])
+        self.assertEqual([0.25, 4.0 / 3, NoteContainer(['D'])], t[0][1])
+        self.assertEqual(1.0, t[0].current_beat)
+
+    def test_MIDI_to_Composition_exact(self):
+        t = Track()
+        for i in range(200):
+            b = Bar()
+            for j in range(12):
+                b.place_notes('C', 12)
+            t + b
+        midi_file_out.write_Track(self.file, t)
+        (c, bpm) = midi_file_in.MIDI_to_Composition(self.file)
+        self.assertEqual(200, len(c.tracks[0]))
+        last = c.tracks[0][-1]
+        self.assertEqual(12, len(last))
+        self.assertEqual(11 / 12.0, last[11][0])
+        self.assertEqual(12.0, last[11][1])
+
+    def test_MIDI_to_Composition_tempo_map(self):
+        self.composition.tempo_map = TempoMap(96, 100)
+        self.composition.tempo_map.set_bpm(96 * 4, 60)
+        self.composition.tempo_map.set_bpm(96 * 6, 200)
+        midi_file_out.write_Composition(self.file, self.composition)
+        (c, bpm) = midi_file_in.MIDI_to_Composition(self.file)
+        self.assertEqual(200, bpm)
+        self.assertEqual([(0, 600000), (72 * 4, 1000000), (72 * 6,
+                         300000)], list(c.tempo_map))
+        self.assertAlmostEqual(4.4, c.tempo_map.tick_to_seconds(72 * 6))
+        self.assertEqual(2, len(c.tracks))
+
+    def test_MIDI_to_Composition_round_trip(self):
+        self.composition.tempo_map = TempoMap(96, 100)
+        midi_file_out.write_Composition(self.file, self.composition)
+        for i in range(3):
+            (c, bpm) = midi_file_in.MIDI_to_Composition(self.file)
+            self.assertEqual([2, 2], [len(t) for t in c.tracks])
+            midi_file_out.write_Composition(self.file, c)
+
+    def test_track_data_to_Composition_tempo(self):
+        tempo = lambda mpqn: [0, {'event': 0x0f, 'meta_event': 81, 'data':
+                              struct.pack('>I', mpqn)[1:]}]
+        note = [[0, {'event': 9, 'channel': 0, 'param1': 60, 'param2': 90}],
+                [96, {'event': 8, 'channel': 0, 'param1': 60, 'param2': 0}]]
+        tracks = [[tempo(500000)], [tempo(250000)] + note, note]
+        m = midi_file_in.MidiFile()
+        division = {'fps': False, 'ticks_per_beat': 96}
+        (c, bpm) = m.track_data_to_Composition((1, 3, division), tracks)
+        self.assertEqual(2, len(c.tracks))
+        self.assertEqual([(0, 500000)], list(c.tempo_map))
+        (c, bpm) = m.track_data_to_Composition((2, 3, division), tracks)
+        self.assertEqual(3, len(c.tracks))
+        self.assertEqual([(0, 500000)], list(c.tempo_map))
+        self.assertEqual([(0, 250000)], list(c.tracks[1].tempo_map))
+        self.assertEqual([(0, 500000)], list(c.tracks[2].tempo_map))
+
+    def test_MidiFileBatch(self):
+        (fd, bad) = tempfile.mkstemp(suffix='.mid')
+        os.write(fd, b'not a MIDI file')
+        os.close(fd)
+        try:
+            for ordered in [True, False]:
+                batch = midi_file_in.MidiFileBatch([self.file, bad, self.file],
+                        processes=2, max_pending=2, ordered=ordered)
+                result = list(batch)
+                self.assertEqual(2, len(result))
+                self.assertEqual([self.file, self.file], [f for (f, c, bpm) in
+                                 result])
+                self.assertEqual(2, len(result[0][1].tracks))
+                self.assertEqual(1, len(batch.errors))
+                self.assertEqual(bad, batch.errors[0][0])
+                self.assertTrue(isinstance(batch.errors[0][1],
+                                midi_file_in.HeaderError))
+                self.assertTrue(batch.events > 0)
+                self.assertTrue(batch.files_per_second() > 0)
+        finally:
+            os.remove(bad)
+
+    def test_MidiFileBatch_unicode(self):
+        batch = midi_file_in.MidiFileBatch(self.file.decode('ascii'))
+        self.assertEqual([self.file], batch.files)
+
+    def test_MidiFileBatch_worker_error(self):
+        convert = midi_file_in._convert_MIDI_file
+        midi_file_in._convert_MIDI_file = _unpicklable_result
+        try:
+            batch = midi_file_in.MidiFileBatch([self.file] * 3, processes=2,
+                    ordered=False)
+            self.assertRaises(Exception, list, batch)
+        finally:
+            midi_file_in._convert_MIDI_file = convert
+
+    def test_MIDI_to_Composition(self):
+        (c, bpm) = midi_file_in.MIDI_to_Composition(self.file)
+        self.assertEqual(120, bpm)
+        self.assertEqual(2, len(c.tracks))
+        self.assertEqual(self.composition.tracks[0][0][2][2],
+                         c.tracks[0][0][2][2])
+
+
+def _unpicklable_result(file):
+    return (file, lambda: None, 120, None, 0)
+
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(test_MidiFileIn)
@@ -0,0 +1,72 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import sys
+sys.path += ['../']
+import io
+import os
+import tempfile
+import mingus.midi.midi_file_out as midi_file_out
+from mingus.midi.midi_track import MidiTrack
+from mingus.containers import *
+import unittest
+
+
+class Unseekable(object):
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+
+
+class test_MidiFileOut(unittest.TestCase):
+
+    def setUp(self):
+        t = Track()
+        b = Bar()
+        b + 'C'
+        b + ['E', 'G']
+        t + b
+        self.composition = Composition()
+        self.composition.add_track(t)
+        self.composition.add_track(t)
+
+    def test_write_Composition_file_object(self):
+        (fd, file) = tempfile.mkstemp(suffix='.mid')
+        os.close(fd)
+        try:
+            midi_file_out.write_Composition(file, self.composition)
+            f = open(file, 'rb')
+            expected = f.read()
+            f.close()
+        finally:
+            os.remove(file)
+        fp = io.BytesIO()
+        self.assertTrue(midi_file_out.write_Composition(fp,
+                        self.composition))
+        self.assertEqual(expected, fp.getvalue())
+        fp = Unseekable()
+        self.assertTrue(midi_file_out.write_Composition(fp,
+                        self.composition))
+        self.assertEqual(expected, b''.join(fp.chunks))
+
+    def test_write_to(self):
+        tracks = [MidiTrack(), MidiTrack(), MidiTrack()]
+        tracks[1].reset()
+        m = midi_file_out.MidiFile(tracks)
+        fp = io.BytesIO()
+        self.assertEqual(len(m.get_midi_data()), m.write_to(fp))
+        self.assertEqual(m.get_midi_data(), fp.getvalue())
+
+    def test_write_to_patch_header(self):
+        m = midi_file_out.MidiFile()
+        fp = io.BytesIO()
+        fp.write(b'xx')
+        m.write_to(fp, (MidiTrack() for i in range(3)))
+        self.assertEqual(b'\x00\x03', fp.getvalue()[12:14])
+        self.assertEqual(len(fp.getvalue()), fp.tell())
+
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(test_MidiFileOut)
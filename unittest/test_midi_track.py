@@ -0,0 +1,52 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import sys
+sys.path += ['../']
+from mingus.midi.midi_track import MidiTrack
+from mingus.containers import *
+import struct
+import unittest
+
+
+class test_MidiTrack(unittest.TestCase):
+
+    def setUp(self):
+        self.t = MidiTrack(120)
+
+    def test_init(self):
+        self.assertEqual(b'\x00\xff\x51\x03\x07\xa1\x20',
+                         bytes(self.t.track_data))
+
+    def test_midi_event(self):
+        self.assertEqual(b'\x00\x93\x3c\x40', self.t.midi_event(0x09, 3, 60,
+                         64))
+        self.assertEqual(b'\x00\xc1\x05', self.t.midi_event(0x0C, 1, 5))
+
+    def test_write_midi_event(self):
+        self.t.reset()
+        self.t.set_deltatime(200)
+        self.t.write_midi_event(0x08, 15, 60, 0)
+        self.assertEqual(self.t.midi_event(0x08, 15, 60, 0),
+                         bytes(self.t.track_data))
+
+    def test_play_Note(self):
+        self.t.reset()
+        self.t.play_Note(Note('C', 4))
+        self.t.set_deltatime(0x48)
+        self.t.stop_Note(Note('C', 4))
+        self.assertEqual(b'\x00\x91\x3c\x40\x48\x81\x3c\x40',
+                         bytes(self.t.track_data))
+
+    def test_get_midi_data(self):
+        t = Track()
+        for i in range(100):
+            t + 'C'
+        self.t.play_Track(t)
+        data = self.t.get_midi_data()
+        self.assertEqual(b'MTrk', data[:4])
+        self.assertEqual((len(data) - 8, ), struct.unpack('>L', data[4:8]))
+        self.assertEqual(b'\x00\xff\x2f\x00', data[-4:])
+
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(test_MidiTrack)
@@ -0,0 +1,334 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import sys
+sys.path += ['../']
+from mingus.midi.sequencer import Sequencer
+from mingus.midi.sequencer_observer import SequencerObserver
+from mingus.midi.tempo_map import TempoMap
+from mingus.midi.playback_plan import PlaybackPlan
+from mingus.containers import *
+import unittest
+
+
+class RecordingSequencer(Sequencer):
+
+    def init(self):
+        self.events = []
+
+    def play_event(self, note, channel, velocity):
+        self.events.append(('play', note, channel, velocity))
+
+    def stop_event(self, note, channel):
+        self.events.append(('stop', note, channel))
+
+    def cc_event(self, channel, control, value):
+        self.events.append(('cc', channel, control, value))
+
+    def sleep(self, seconds):
+        self.events.append(('sleep', seconds))
+
+
+class ClockSequencer(RecordingSequencer):
+
+    """Sleeps on a virtual clock, oversleeping by a fixed amount."""
+
+    def init(self):
+        RecordingSequencer.init(self)
+        self.now = 0.0
+        self.overshoot = 0.0
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        RecordingSequencer.sleep(self, seconds)
+        self.now += seconds + self.overshoot
+
+
+class NoInitSequencer(Sequencer):
+
+    def __init__(self):
+        pass
+
+
+class RecordingObserver(SequencerObserver):
+
+    def __init__(self):
+        self.notes = []
+
+    def play_int_note_event(self, int_note, channel, velocity):
+        self.notes.append(('play', int_note, channel, velocity))
+
+    def stop_Note(self, note, channel):
+        self.notes.append(('stop', note, channel))
+
+    def stop_everything(self, notes):
+        self.notes.append(('stop_everything', notes))
+
+
+class NoteOnListener(object):
+
+    msg_types = [Sequencer.MSG_PLAY_INT]
+
+    def __init__(self):
+        self.messages = []
+
+    def notify(self, msg_type, params):
+        self.messages.append((msg_type, params))
+
+
+class test_Sequencer(unittest.TestCase):
+
+    def setUp(self):
+        self.s = ClockSequencer()
+        t = Track()
+        b = Bar()
+        b + 'C'
+        b + 'E'
+        b + 'G'
+        b + 'C'
+        t + b
+        t + b
+        self.c = Composition()
+        self.c.add_track(t)
+
+    def sleeps(self):
+        return [e[1] for e in self.s.events if e[0] == 'sleep']
+
+    def test_play_Composition(self):
+        self.s.play_Composition(self.c, bpm=60)
+        self.assertEqual([1.0] * 8, self.sleeps())
+        self.assertEqual(('play', 60, 1, 64), self.s.events[0])
+        self.assertEqual(('stop', 60, 1), self.s.events[-1])
+
+    def test_play_Composition_messages(self):
+        o = RecordingObserver()
+        self.s.attach(o)
+        self.assertEqual({'bpm': 60}, self.s.play_Composition(self.c,
+                         bpm=60))
+        self.assertEqual(('stop', Note('C'), 1), o.notes[1])
+
+    def test_play_Plan_trailing_rest(self):
+        t = Track()
+        b = Bar()
+        b + 'C'
+        b + None
+        t + b
+        plan = PlaybackPlan.from_Track(t, 1, 60)
+        self.assertEqual(1.0, plan.duration)
+        self.assertEqual(4.0, plan.length)
+        self.s.play_Plan(plan, 2)
+        self.assertEqual(5.0, self.s.now)
+        self.assertEqual([1.0, 3.0, 1.0], self.sleeps())
+
+    def test_play_Composition_bars(self):
+        self.s.play_Composition(self.c, bpm=60, scheduled=False)
+        self.assertEqual([1.0] * 8, self.sleeps())
+        self.assertEqual(('play', 60, 1, 64), self.s.events[0])
+
+    def test_play_Composition_tempo_map(self):
+        self.c.tempo_map = TempoMap(96, 60)
+        self.c.tempo_map.set_bpm(96 * 4, 120)
+        self.c.tempo_map.set_bpm(96 * 6 + 48, 240)
+        for scheduled in [True, False]:
+            self.s.init()
+            self.s.play_Composition(self.c, scheduled=scheduled)
+            self.assertEqual([1.0] * 4 + [0.5, 0.5, 0.375, 0.25],
+                             self.sleeps())
+
+    def test_compile_Composition(self):
+        events = self.s.compile_Composition(self.c, bpm=60)
+        self.assertEqual((0.0, Sequencer.EVENT_INSTR, 1, 1, 0), events[0])
+        self.assertEqual((0.0, Sequencer.EVENT_PLAY, 1, 60, 64), events[1])
+        self.assertEqual((1.0, Sequencer.EVENT_STOP, 1, 60, 0), events[2])
+        self.assertEqual((1.0, Sequencer.EVENT_PLAY, 1, 64, 64), events[3])
+        self.assertEqual((8.0, Sequencer.EVENT_STOP, 1, 60, 0), events[-1])
+        self.assertEqual(17, len(events))
+
+    def test_compile_Composition_bpm(self):
+        b = Bar()
+        b + 'C'
+        b + 'E'
+        b.bar[1][2].bpm = 120
+        b + 'G'
+        b + 'C'
+        self.c.tracks[0] + b
+        events = self.s.compile_Composition(self.c, bpm=60)
+        self.assertEqual([8.0, 9.0, 9.5, 10.0], [e[0] for e in events
+                         if e[1] == Sequencer.EVENT_PLAY][-4:])
+
+    def test_compile_Composition_tempo_map(self):
+        self.c.tempo_map = TempoMap(96, 60)
+        self.c.tempo_map.set_bpm(96 * 4, 120)
+        events = self.s.compile_Composition(self.c)
+        self.assertEqual(6.0, events.duration)
+
+    def test_play_Plan(self):
+        plan = self.s.compile_Composition(self.c, bpm=60)
+        self.assertEqual(plan, PlaybackPlan.from_Track(self.c.tracks[0], 1,
+                         60))
+        self.assertEqual(plan[8:], plan.events_from(4.0))
+        report = self.s.play_Plan(plan, 3)
+        self.assertEqual(3 * 17, report['events'])
+        self.assertEqual(24.0, self.s.now)
+        self.assertEqual(24, len(self.sleeps()))
+        self.assertEqual(0.0, report['max'])
+        self.s.init()
+        self.assertEqual(8.0, self.s.play_Composition(plan)['timing'
+                         ]['duration'])
+
+    def test_play_events(self):
+        s = ClockSequencer()
+        t = Track()
+        for i in range(500):
+            b = Bar()
+            for j in range(3):
+                b.place_notes('C', 3)
+            t + b
+        c = Composition()
+        c.add_track(t)
+        s.overshoot = 0.001
+        res = s.play_Composition(c, bpm=60, scheduled=True)
+        report = res['timing']
+        self.assertEqual(3001, report['events'])
+        self.assertTrue(report['max'] <= 0.001 + 1e-9)
+        self.assertTrue(abs(report['drift']) <= 0.001 + 1e-9)
+        self.assertAlmostEqual(2000.0, s.now, 2)
+        self.assertEqual(('play', 12 + 48, 1, 64), s.events[0])
+        self.assertEqual(('stop', 12 + 48, 1), s.events[-1])
+
+        # Playing bar by bar, the oversleeping adds up
+        s.init()
+        s.overshoot = 0.001
+        s.play_Composition(c, bpm=60, scheduled=False)
+        self.assertAlmostEqual(2000.0 + 1.5, s.now, 2)
+
+    def test_attach_SequencerObserver(self):
+        o = RecordingObserver()
+        self.s.attach(o)
+        self.s.play_Note(Note('C'))
+        self.s.stop_Note(Note('C'))
+        self.assertEqual([('play', 60, 1, 64), ('stop', Note('C'), 1)],
+                         o.notes)
+
+    def test_attach_msg_types(self):
+        l = NoteOnListener()
+        self.s.attach(l)
+        self.s.play_Composition(self.c, bpm=60, scheduled=False)
+        self.assertEqual(8, len(l.messages))
+        self.assertEqual((Sequencer.MSG_PLAY_INT, {'channel': 1, 'note': 60,
+                         'velocity': 64}), l.messages[0])
+        self.s.attach(l, [Sequencer.MSG_STOP_INT, Sequencer.MSG_SLEEP])
+        self.s.play_Composition(self.c, bpm=60)
+        self.assertEqual(8 + 16, len(l.messages))
+        self.assertEqual(Sequencer.MSG_SLEEP, l.messages[8][0])
+        self.assertEqual([l], self.s.listeners)
+        self.s.detach(l)
+        self.assertFalse(self.s.listening(Sequencer.MSG_SLEEP))
+
+    def test_listeners_appended(self):
+        l = NoteOnListener()
+        o = RecordingObserver()
+        self.s.attach(l, [Sequencer.MSG_SLEEP])
+        self.s.listeners.append(o)
+        self.s.play_Note(Note('C'))
+        self.assertEqual([('play', 60, 1, 64)], o.notes)
+        self.s.listeners.remove(o)
+        self.s.stop_Note(Note('C'))
+        self.assertEqual([('play', 60, 1, 64)], o.notes)
+        self.assertTrue(self.s.listening(Sequencer.MSG_SLEEP))
+        self.assertFalse(self.s.listening(Sequencer.MSG_PLAY_INT))
+
+    def test_play_events_sleep(self):
+        # Without a sleep of its own, a sequencer waits with time.sleep
+        s = NoInitSequencer()
+        played = []
+        s.play_event = lambda note, channel, velocity: played.append(
+            s.clock())
+        start = s.clock()
+        report = s.play_events([(0.0, Sequencer.EVENT_PLAY, 1, 60, 64),
+                               (0.05, Sequencer.EVENT_PLAY, 1, 64, 64)])
+        self.assertEqual(2, len(played))
+        self.assertTrue(played[1] - start >= 0.05)
+        self.assertTrue(report['max'] < 0.05)
+
+    def test_no_init(self):
+        s = NoInitSequencer()
+        l = NoteOnListener()
+        s.attach(l, [Sequencer.MSG_CC])
+        s.control_change(1, 7, 100)
+        self.assertEqual([(Sequencer.MSG_CC, {'channel': 1, 'control': 7,
+                         'value': 100})], l.messages)
+        s.play_Note(Note('C'))
+        self.assertEqual({(1, 60): 1}, s.sounding)
+        s.stop_everything()
+        self.assertEqual({}, s.sounding)
+
+    def test_msg_types(self):
+        self.assertEqual(sorted([getattr(Sequencer, name) for name in
+                         dir(Sequencer) if name.startswith('MSG_') and name
+                         != 'MSG_TYPES']), list(Sequencer.MSG_TYPES))
+
+    def test_notify_listeners_lazy(self):
+        calls = []
+
+        def params():
+            calls.append(1)
+            return {'s': 1.0}
+        self.s.notify_listeners(Sequencer.MSG_SLEEP, params)
+        self.assertEqual([], calls)
+        l = NoteOnListener()
+        self.s.attach(l, [Sequencer.MSG_SLEEP])
+        self.s.notify_listeners(Sequencer.MSG_SLEEP, params)
+        self.s.notify_listeners(Sequencer.MSG_PLAY_INT, params)
+        self.assertEqual([1], calls)
+        self.assertEqual([(Sequencer.MSG_SLEEP, {'s': 1.0})], l.messages)
+
+    def test_stop_everything(self):
+        o = RecordingObserver()
+        self.s.attach(o)
+        self.s.play_Note(Note('C'))
+        self.s.play_Note(Note('E'), velocity=80)
+        self.s.play_Note(Note('E', 5))
+        self.s.stop_Note(Note('E', 5))
+        n = Note('G')
+        n.channel = 3
+        self.s.play_Note(n)
+        self.assertEqual({(1, 60): 1, (1, 64): 1, (3, 67): 1},
+                         self.s.sounding)
+        del self.s.events[:]
+        self.s.stop_everything()
+        self.assertEqual([('stop', 60, 1), ('stop', 64, 1), ('stop', 67, 3)],
+                         self.s.events)
+        self.assertEqual(('stop_everything', [(1, 60), (1, 64), (3, 67)]),
+                         o.notes[-1])
+        self.assertEqual({}, self.s.sounding)
+
+    def test_sounding_twice(self):
+        self.s.play_Note(Note('C'))
+        self.s.play_Note(Note('C'))
+        self.s.stop_Note(Note('C'))
+        self.assertEqual({(1, 60): 1}, self.s.sounding)
+        del self.s.events[:]
+        self.s.stop_everything()
+        self.assertEqual([('stop', 60, 1)], self.s.events)
+        self.assertEqual({}, self.s.sounding)
+
+    def test_stop_everything_all_notes_off(self):
+        self.s.play_Note(Note('C'))
+        del self.s.events[:]
+        self.s.stop_everything(True)
+        self.assertEqual([('cc', c, 123, 0) for c in range(16)],
+                         self.s.events)
+        self.assertEqual({}, self.s.sounding)
+
+    def test_sounding_play_Plan(self):
+        plan = self.s.compile_Composition(self.c, bpm=60)
+        self.s.play_Plan(plan)
+        self.assertEqual({}, self.s.sounding)
+        self.s.play_events(plan[:-1])
+        self.assertEqual({(1, 60): 1}, self.s.sounding)
+
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(test_Sequencer)
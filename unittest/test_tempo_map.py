@@ -0,0 +1,47 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import sys
+sys.path += ['../']
+from mingus.midi.tempo_map import TempoMap
+import unittest
+
+
+class test_TempoMap(unittest.TestCase):
+
+    def setUp(self):
+        # 120 bpm, 60 bpm from beat 4 on, 240 bpm from beat 8 on
+        self.t = TempoMap(96)
+        self.t.set_bpm(96 * 8, 240)
+        self.t.set_tempo(96 * 4, 1000000)
+
+    def test_tick_to_seconds(self):
+        self.assertEqual(0.0, self.t.tick_to_seconds(0))
+        self.assertEqual(1.0, self.t.tick_to_seconds(96 * 2))
+        self.assertEqual(2.0, self.t.tick_to_seconds(96 * 4))
+        self.assertEqual(6.0, self.t.tick_to_seconds(96 * 8))
+        self.assertEqual(6.5, self.t.tick_to_seconds(96 * 10))
+
+    def test_seconds_to_tick(self):
+        for tick in [0, 48, 96 * 4, 96 * 5 + 12, 96 * 8, 96 * 100]:
+            self.assertAlmostEqual(tick, self.t.seconds_to_tick(
+                                   self.t.tick_to_seconds(tick)))
+
+    def test_bpm_at(self):
+        self.assertEqual(120, self.t.bpm_at(0))
+        self.assertEqual(60, self.t.bpm_at(96 * 4))
+        self.assertEqual(60, self.t.bpm_at(96 * 8 - 1))
+        self.assertEqual(240, self.t.bpm_at(96 * 8))
+
+    def test_set_tempo_replace(self):
+        self.t.set_bpm(0, 60)
+        self.assertEqual(3, len(self.t))
+        self.assertEqual(4.0, self.t.tick_to_seconds(96 * 4))
+        self.assertEqual(4.0, self.t.beats_to_seconds(4))
+
+    def test_iter(self):
+        self.assertEqual([(0, 500000), (96 * 4, 1000000), (96 * 8, 250000)],
+                         list(self.t))
+
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(test_TempoMap)
@@ -0,0 +1,143 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import sys
+sys.path += ['../']
+import threading
+import time
+from mingus.containers import *
+from mingus.midi.playback_plan import PlaybackPlan
+from mingus.midi.transport import Transport
+from test_sequencer import RecordingSequencer
+import unittest
+
+
+class ThreadSequencer(RecordingSequencer):
+
+    """Records the events and lets the tests wait for them."""
+
+    def init(self):
+        RecordingSequencer.init(self)
+        self.condition = threading.Condition()
+
+    def play_event(self, note, channel, velocity):
+        self.condition.acquire()
+        try:
+            RecordingSequencer.play_event(self, note, channel, velocity)
+            self.condition.notify_all()
+        finally:
+            self.condition.release()
+
+    def instr_event(self, channel, instr, bank):
+        self.events.append(('instr', channel, instr))
+
+    def plays(self):
+        return [e[1] for e in self.events if e[0] == 'play']
+
+    def wait_plays(self, n, timeout=5):
+        """Wait until n notes have been played."""
+        end = time.time() + timeout
+        self.condition.acquire()
+        try:
+            while len(self.plays()) < n and time.time() < end:
+                self.condition.wait(end - time.time())
+        finally:
+            self.condition.release()
+        return len(self.plays()) >= n
+
+
+class test_Transport(unittest.TestCase):
+
+    def setUp(self):
+        self.s = ThreadSequencer()
+        t = Track()
+        for i in range(4):
+            b = Bar()
+            b + 'C'
+            b + 'E'
+            b + 'G'
+            b + 'C'
+            t + b
+        self.c = Composition()
+        self.c.add_track(t)
+
+    def tearDown(self):
+        self.s.stop()
+
+    def test_start(self):
+        transport = self.s.start(self.c, bpm=6000)
+        self.assertTrue(transport.wait(5))
+        self.assertEqual([60, 64, 67, 60] * 4, self.s.plays())
+        self.assertEqual({}, self.s.sounding)
+        self.assertFalse(self.s.stop())
+
+    def test_pause_seek_resume(self):
+        transport = self.s.start(self.c, bpm=60)
+        self.assertTrue(self.s.wait_plays(1))
+        self.assertTrue(self.s.pause())
+        transport.sync()
+        self.assertEqual([60], self.s.plays())
+        self.assertEqual({}, self.s.sounding)
+        self.assertEqual(('stop', 60, 1), self.s.events[-1])
+        position = transport.position()
+        self.assertTrue(position < 1.0)
+        self.assertEqual(position, transport.position())
+        self.s.seek(14.0)
+        self.s.set_tempo(6000)
+        self.s.resume()
+        self.assertTrue(transport.wait(5))
+        self.assertEqual([60, 67, 60], self.s.plays())
+        self.assertEqual(('instr', 1, 1), self.s.events[3])
+        latency = transport.latency()
+        self.assertEqual(4, latency['commands'])
+        self.assertTrue(latency['max'] < 0.1)
+
+    def test_loop(self):
+        plan = PlaybackPlan.from_Track(self.c.tracks[0], 1, 6000)
+        transport = Transport(self.s, plan)
+        self.s.transport = transport
+        transport.loop(0.01, 0.03)
+        transport.start()
+        self.assertTrue(self.s.wait_plays(17))
+        self.assertTrue(transport.playing())
+        self.assertTrue(self.s.stop())
+        self.assertFalse(transport.playing())
+        plays = self.s.plays()
+        self.assertEqual([60] + [64, 67] * 8, plays[:17])
+        self.assertEqual(('instr', 1, 1), self.s.events[0])
+        self.assertTrue(self.s.events.count(('instr', 1, 1)) >= 8)
+        self.assertEqual({}, self.s.sounding)
+
+    def test_loop_region(self):
+        transport = self.s.start(self.c, bpm=240)
+        for (start, end) in [(0.5, 0.2), (0, 0), (100, None), (-1, 1), (0,
+                             5)]:
+            self.assertRaises(ValueError, transport.loop, start, end)
+        transport.loop(1.0)
+        transport.sync()
+        self.assertEqual((1.0, 4.0), transport.loop_region)
+        self.assertTrue(self.s.stop())
+        self.assertFalse(transport.playing())
+
+    def test_stop_everything_while_playing(self):
+        t = Track()
+        for i in range(200):
+            b = Bar()
+            for j in range(16):
+                b.place_notes(['C', 'E', 'G'], 16)
+            t + b
+        self.s.start(PlaybackPlan.from_Track(t, 1, 6000000))
+        while self.s.transport.playing():
+            self.s.stop_everything()
+        self.assertTrue(len(self.s.plays()) > 0)
+        self.s.stop_everything()
+        self.assertEqual({}, self.s.sounding)
+
+    def test_sync_after_end(self):
+        transport = self.s.start(self.c, bpm=6000)
+        self.assertTrue(transport.wait(5))
+        transport.pause()
+        transport.sync()
+
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(test_Transport)
@@ -0,0 +1,84 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import sys
+sys.path += ['../']
+import io
+from math import log
+from struct import pack
+import mingus.midi.varbyte as varbyte
+import unittest
+
+
+def old_int_to_varbyte(value):
+    """The float based implementation that MidiTrack used before."""
+    length = int(log(max(value, 1), 0x80)) + 1
+    bytes = [value >> i * 7 & 0x7F for i in range(length)]
+    bytes.reverse()
+    for i in range(len(bytes) - 1):
+        bytes[i] = bytes[i] | 0x80
+    return pack('%sB' % len(bytes), *bytes)
+
+
+def old_parse_varbyte_as_int(fp):
+    """The byte by byte implementation that MidiFile used before."""
+    result = 0
+    r = 0x80
+    while r & 0x80:
+        r = ord(fp.read(1))
+        if r & 0x80:
+            result = (result << 7) + (r & 0x7F)
+        else:
+            result = (result << 7) + r
+    return result
+
+
+class test_varbyte(unittest.TestCase):
+
+    def setUp(self):
+        # Every one and two byte value, the values around every length
+        # boundary and a sweep through the three and four byte values.
+        self.values = list(range(0x4000))
+        for n in [1, 2, 3, 4]:
+            edge = 1 << 7 * n
+            self.values += list(range(edge - 3, edge + 3))
+        self.values += list(range(0x4000, varbyte.MAX_VALUE, 997))
+        self.values = [v for v in self.values if v <= varbyte.MAX_VALUE]
+
+    def test_encode(self):
+        for v in self.values:
+            self.assertEqual(old_int_to_varbyte(v), varbyte.encode(v))
+
+    def test_length(self):
+        for v in self.values:
+            self.assertEqual(len(old_int_to_varbyte(v)), varbyte.length(v))
+
+    def test_decode(self):
+        for v in self.values:
+            data = bytearray(b'\xff' + old_int_to_varbyte(v) + b'\x00')
+            self.assertEqual((v, len(data) - 1), varbyte.decode(data, 1))
+
+    def test_read(self):
+        for v in self.values[::37]:
+            data = old_int_to_varbyte(v)
+            self.assertEqual(v, old_parse_varbyte_as_int(io.BytesIO(data)))
+            self.assertEqual((v, len(data)), varbyte.read(io.BytesIO(data)))
+        self.assertRaises(IOError, varbyte.read, io.BytesIO(b'\x81'))
+
+    def test_encode_all(self):
+        self.assertEqual(b''.join([old_int_to_varbyte(v) for v in
+                         self.values]), varbyte.encode_all(self.values))
+
+    def test_decode_all(self):
+        data = bytearray(varbyte.encode_all(self.values))
+        self.assertEqual(self.values, varbyte.decode_all(data))
+        self.assertEqual([0x4000, 0], varbyte.decode_all(bytearray(
+                         b'\x7f\x81\x80\x00\x00'), 1))
+
+    def test_encode_range(self):
+        self.assertRaises(ValueError, varbyte.encode, -1)
+        self.assertRaises(ValueError, varbyte.encode, varbyte.MAX_VALUE + 1)
+        self.assertRaises(ValueError, varbyte.encode_all, [1, -1])
+
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(test_varbyte)